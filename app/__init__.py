@@ -19,10 +19,45 @@ def create_app():
     app.config.from_object(Config)
     celery.conf.update(app.config)
 
+    class ContextTask(celery.Task):
+        # Run every task inside this app's context so tasks can use db and current_app
+        def __call__(self, *args, **kwargs):
+            with app.app_context():
+                return self.run(*args, **kwargs)
+
+    celery.Task = ContextTask
+
     db.init_app(app)
     migrate.init_app(app, db)
     login_manager.init_app(app)
 
+    from app.email_utils import smtp_pool
+    smtp_pool.init_app(app)
+
+    from app.rate_limit import rate_limiter
+    rate_limiter.init_app(app)
+
+    from app.write_behind import status_buffer
+    status_buffer.init_app(app)
+
+    from app.log_sink import log_sink
+    log_sink.init_app(app)
+
+    from app.render import render_plans
+    render_plans.init_app(app)
+
+    from app.credentials import credential_cache
+    credential_cache.init_app(app)
+
+    from app.control import campaign_control
+    campaign_control.init_app(app)
+
+    from app.progress import progress_hub
+    progress_hub.init_app(app)
+
+    from app.status_cache import status_cache
+    status_cache.init_app(app)
+
     from app.auth import bp as auth_bp
     app.register_blueprint(auth_bp, url_prefix='/auth')
 
@@ -44,6 +79,15 @@ def create_app():
     from app.settings import bp as settings_bp
     app.register_blueprint(settings_bp, url_prefix='/settings')
 
+    from app.counters import reconcile_counters_command
+    app.cli.add_command(reconcile_counters_command)
+
+    from app.rollups import rebuild_rollups_command
+    app.cli.add_command(rebuild_rollups_command)
+
+    from app.retention import logs_command
+    app.cli.add_command(logs_command)
+
     from app.sending import bp as sending_bp
     app.register_blueprint(sending_bp, url_prefix='/sending')
 
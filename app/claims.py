@@ -0,0 +1,87 @@
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, update
+from app import db
+from app.models import ReceiverEmail
+
+# Lease-based work distribution. A worker moves a batch of pending receivers to
+# 'claimed' under its owner id with a lease expiry, so any number of workers
+# can pull from the same campaign without sending to anyone twice. Leases are
+# extended while the worker is alive; once one expires the receivers go back
+# to 'pending' on the next claim by anyone, resuming a crashed worker's batch.
+# 'claimed' receivers count as pending in the campaign counters.
+
+def new_owner():
+    return f'{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+def _reclaim_expired(conn, campaign_id, now):
+    table = ReceiverEmail.__table__
+    return conn.execute(update(table)
+                        .where(table.c.campaign_id == campaign_id, table.c.status == 'claimed',
+                               table.c.lease_expires_at < now)
+                        .values(status='pending', claimed_by=None, lease_expires_at=None)).rowcount
+
+def claim_receivers(campaign_id, owner, limit, lease_seconds, after_id=0):
+    # Claims up to `limit` pending receivers with ids above `after_id`, lowest
+    # first: a keyset page over the (campaign_id, status, id) index. Postgres
+    # skips rows other workers are claiming right now (FOR UPDATE SKIP LOCKED);
+    # SQLite serializes writers, so its UPDATE ... RETURNING is atomic as is.
+    # Returns (id, email) tuples in id order.
+    table = ReceiverEmail.__table__
+    now = datetime.utcnow()
+    claim = dict(status='claimed', claimed_by=owner, lease_expires_at=now + timedelta(seconds=lease_seconds))
+    with db.engine.begin() as conn:
+        _reclaim_expired(conn, campaign_id, now)
+        candidates = select(table.c.id) \
+            .where(table.c.campaign_id == campaign_id, table.c.status == 'pending', table.c.id > after_id) \
+            .order_by(table.c.id) \
+            .limit(limit)
+        if conn.dialect.name == 'postgresql':
+            candidates = candidates.with_for_update(skip_locked=True)
+        if conn.dialect.name in ('postgresql', 'sqlite'):
+            claimed = conn.execute(update(table)
+                                   .where(table.c.id.in_(candidates), table.c.status == 'pending')
+                                   .values(**claim)
+                                   .returning(table.c.id, table.c.email)).all()
+            return sorted((receiver_id, email) for receiver_id, email in claimed)
+
+        # No RETURNING: claim with a status guard, then read back what we got
+        ids = conn.execute(candidates).scalars().all()
+        if not ids:
+            return []
+        conn.execute(update(table).where(table.c.id.in_(ids), table.c.status == 'pending').values(**claim))
+        rows = conn.execute(select(table.c.id, table.c.email)
+                            .where(table.c.id.in_(ids), table.c.claimed_by == owner, table.c.status == 'claimed')
+                            .order_by(table.c.id)).all()
+        return [(receiver_id, email) for receiver_id, email in rows]
+
+def extend_leases(campaign_id, owner, lease_seconds):
+    table = ReceiverEmail.__table__
+    with db.engine.begin() as conn:
+        return conn.execute(update(table)
+                            .where(table.c.campaign_id == campaign_id, table.c.claimed_by == owner,
+                                   table.c.status == 'claimed')
+                            .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds))).rowcount
+
+def release_claims(campaign_id, owner):
+    # Hands back every receiver `owner` still holds unsent. Buffered status
+    # updates must be flushed first, or receivers just sent would be released.
+    table = ReceiverEmail.__table__
+    with db.engine.begin() as conn:
+        return conn.execute(update(table)
+                            .where(table.c.campaign_id == campaign_id, table.c.claimed_by == owner,
+                                   table.c.status == 'claimed')
+                            .values(status='pending', claimed_by=None, lease_expires_at=None)).rowcount
+
+def count_live_claims(campaign_id, exclude_owner=None):
+    # Receivers other workers hold under unexpired leases
+    table = ReceiverEmail.__table__
+    query = select(func.count()).select_from(table) \
+        .where(table.c.campaign_id == campaign_id, table.c.status == 'claimed',
+               table.c.lease_expires_at >= datetime.utcnow())
+    if exclude_owner is not None:
+        query = query.where(table.c.claimed_by != exclude_owner)
+    with db.engine.connect() as conn:
+        return conn.execute(query).scalar()
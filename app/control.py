@@ -0,0 +1,127 @@
+import threading
+import time
+from sqlalchemy import select
+from app import db
+from app.models import Campaign
+
+# Pause/resume/stop for running campaigns. Campaign.status in the DB is the
+# channel every process watches: one watcher thread per process reads the
+# status of all campaigns it is sending with a single query every `interval`
+# seconds, and the routes that change a status publish it in-process too, so a
+# sender living in the same process reacts at once. Senders wait on
+# threading.Events instead of polling. Every run gets its own signal, so a
+# campaign restarted right after a stop isn't ended by the old run's stop.
+
+class CampaignSignal:
+    # Control state of one run of a campaign as seen by this process. Once
+    # stopped it stays stopped; the next run watches a new signal.
+
+    def __init__(self, campaign_id):
+        self.campaign_id = campaign_id
+        self.running = threading.Event() # Cleared while paused
+        self.stopped = threading.Event()
+        self.halted = threading.Event() # Set while paused or stopped
+        self.running.set()
+
+    def is_paused(self):
+        return not self.running.is_set() and not self.stopped.is_set()
+
+    def is_stopped(self):
+        return self.stopped.is_set()
+
+    def is_halted(self):
+        # Paused or stopped: senders should not start another message
+        return self.halted.is_set()
+
+    def wait_until_running(self, timeout=None):
+        # Blocks while paused; returns True once resumed or stopped, False on timeout
+        return self.running.wait(timeout)
+
+    def wait_until_halted(self, timeout=None):
+        # Sleeps up to `timeout`, waking as soon as the run is paused or stopped
+        return self.halted.wait(timeout)
+
+    def update(self, status):
+        if self.stopped.is_set():
+            return # A stop is final for this run
+        if status == 'paused':
+            self.running.clear()
+            self.halted.set()
+        elif status == 'running':
+            self.running.set()
+            self.halted.clear()
+        else: # Stopped, completed, reset or deleted (None): this run is over
+            self.stopped.set()
+            self.halted.set()
+            self.running.set() # Wake anyone waiting out a pause
+
+class CampaignControl:
+
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = 0.25
+        self._signals = {} # campaign_id -> set of CampaignSignal, one per run in this process
+        self._lock = threading.Lock()
+        self._watcher = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('CAMPAIGN_CONTROL_INTERVAL', self.interval)
+        app.extensions['campaign_control'] = self
+
+    def watch(self, campaign_id):
+        # Returns a new signal for one run of the campaign, read from the DB now
+        # and kept current until unwatch(signal)
+        signal = CampaignSignal(campaign_id)
+        with self._lock:
+            self._signals.setdefault(campaign_id, set()).add(signal)
+            if self._watcher is None or not self._watcher.is_alive():
+                self._watcher = threading.Thread(target=self._watch_statuses, name='campaign-control', daemon=True)
+                self._watcher.start()
+        self.refresh([campaign_id])
+        return signal
+
+    def unwatch(self, signal):
+        with self._lock:
+            signals = self._signals.get(signal.campaign_id)
+            if signals is not None:
+                signals.discard(signal)
+                if not signals:
+                    del self._signals[signal.campaign_id]
+
+    def publish(self, campaign_id, status):
+        # Called after the new Campaign.status is committed; senders in this
+        # process see it immediately, the others on their next refresh
+        with self._lock:
+            signals = list(self._signals.get(campaign_id, ()))
+        for signal in signals:
+            signal.update(status)
+
+    def refresh(self, campaign_ids=None):
+        with self._lock:
+            signals = {campaign_id: list(signals) for campaign_id, signals in self._signals.items()
+                       if campaign_ids is None or campaign_id in campaign_ids}
+        if not signals:
+            return
+        table = Campaign.__table__
+        with self.app.app_context(), db.engine.connect() as conn:
+            statuses = dict(conn.execute(select(table.c.id, table.c.status).where(table.c.id.in_(list(signals)))).all())
+        for campaign_id, run_signals in signals.items():
+            for signal in run_signals:
+                signal.update(statuses.get(campaign_id))
+
+    def _watch_statuses(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._signals:
+                    self._watcher = None
+                    return
+            try:
+                self.refresh()
+            except Exception:
+                self.app.logger.exception("Failed to refresh campaign control statuses")
+
+campaign_control = CampaignControl()
@@ -0,0 +1,56 @@
+from collections import Counter, defaultdict
+import click
+from sqlalchemy import func, update
+from app import db, celery
+from app.models import Campaign, ReceiverEmail
+
+# Campaign.total_emails / emails_pending / emails_sent / emails_failed are the
+# single source for per-status receiver counts. Every status transition
+# updates them in the same transaction as the receiver rows, through
+# campaign_counter_update, so pages read them instead of counting receivers.
+
+def campaign_counter_update(campaign_id, pending=0, sent=0, failed=0):
+    # UPDATE statement applying the given deltas in SQL (col = col + n), so
+    # concurrent writers never lose increments
+    campaign = Campaign.__table__
+    return (update(campaign)
+            .where(campaign.c.id == campaign_id)
+            .values(total_emails=campaign.c.total_emails + (pending + sent + failed),
+                    emails_pending=campaign.c.emails_pending + pending,
+                    emails_sent=campaign.c.emails_sent + sent,
+                    emails_failed=campaign.c.emails_failed + failed))
+
+def reconcile_campaign_counters(campaign_id=None):
+    # Rebuilds the counters from one GROUP BY pass over receiver_email and
+    # repairs any that drifted. Statuses other than sent/failed count as pending.
+    # Returns the number of campaigns whose counters were corrected.
+    counts = defaultdict(Counter)
+    query = db.session.query(ReceiverEmail.campaign_id, ReceiverEmail.status, func.count(ReceiverEmail.id)) \
+        .group_by(ReceiverEmail.campaign_id, ReceiverEmail.status)
+    campaigns = Campaign.query
+    if campaign_id is not None:
+        query = query.filter(ReceiverEmail.campaign_id == campaign_id)
+        campaigns = campaigns.filter_by(id=campaign_id)
+    for row_campaign_id, status, count in query:
+        counts[row_campaign_id][status if status in ('sent', 'failed') else 'pending'] += count
+
+    repaired = 0
+    for campaign in campaigns:
+        campaign_counts = counts[campaign.id]
+        expected = (sum(campaign_counts.values()), campaign_counts['pending'], campaign_counts['sent'], campaign_counts['failed'])
+        if (campaign.total_emails, campaign.emails_pending, campaign.emails_sent, campaign.emails_failed) != expected:
+            campaign.total_emails, campaign.emails_pending, campaign.emails_sent, campaign.emails_failed = expected
+            repaired += 1
+    db.session.commit()
+    return repaired
+
+@celery.task(name='app.counters.reconcile_counters')
+def reconcile_counters(campaign_id=None):
+    return reconcile_campaign_counters(campaign_id)
+
+@click.command('reconcile-counters')
+@click.option('--campaign-id', type=int, default=None, help='Only reconcile this campaign.')
+def reconcile_counters_command(campaign_id):
+    """Rebuild campaign receiver counters from receiver rows."""
+    repaired = reconcile_campaign_counters(campaign_id)
+    click.echo(f'Repaired counters for {repaired} campaign(s).')
@@ -0,0 +1,45 @@
+import hashlib
+import threading
+import time
+
+class CredentialCache:
+    # Decrypted sender passwords, kept in process memory only, so logins don't
+    # pay for a Fernet decrypt each time. An entry is tied to a hash of the
+    # encrypted value it came from, which makes a changed password a miss even
+    # before senders.edit invalidates it, and expires after `ttl` seconds
+    # (0 disables the cache).
+
+    def __init__(self, app=None):
+        self.ttl = 300
+        self._entries = {} # sender_id -> (ciphertext digest, plaintext, expires_at)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('CREDENTIAL_CACHE_TTL', self.ttl)
+        app.extensions['credential_cache'] = self
+
+    def get(self, sender_id, encrypted, decrypt):
+        if sender_id is None or not self.ttl:
+            return decrypt(encrypted)
+        digest = hashlib.sha256(encrypted).digest()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(sender_id)
+            if entry is not None and entry[0] == digest and entry[2] > now:
+                return entry[1]
+        plaintext = decrypt(encrypted)
+        with self._lock:
+            self._entries[sender_id] = (digest, plaintext, now + self.ttl)
+        return plaintext
+
+    def invalidate(self, sender_id=None):
+        # Forget one sender's password, or every password when no id is given
+        with self._lock:
+            if sender_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(sender_id, None)
+
+credential_cache = CredentialCache()
@@ -1,19 +1,36 @@
 import csv
+import zlib
+from datetime import datetime, timedelta
 from io import StringIO
-from flask import render_template, Response, request
+from flask import render_template, Response, request, flash, redirect, url_for
 from flask_login import login_required
 from app import db
 from app.dashboard import bp
 from app.models import LogEntry, SenderEmail, Campaign, ReceiverEmail
-from sqlalchemy import func
+from app.rollups import rollup_totals, throughput
+from app.retention import purge_logs
+from app.log_search import search_logs
+from app.receivers.importer import is_valid_email
+from sqlalchemy import func, select
+
+EXPORT_CHUNK_SIZE = 1000 # Log rows read and written per chunk of a streamed export
+
+# Throughput chart ranges: (rollup granularity, window)
+CHART_RANGES = {
+    'hour': ('minute', timedelta(hours=1)),
+    'day': ('hour', timedelta(days=1)),
+    'month': ('day', timedelta(days=30)),
+}
 
 @bp.route('/')
 @bp.route('/dashboard')
 @login_required
 def dashboard():
-    total_sent = LogEntry.query.filter_by(status='success').count()
-    total_failed = LogEntry.query.filter_by(status='failure').count()
-    total_pending = ReceiverEmail.query.filter_by(status='pending').count()
+    # Totals and the chart come from the rollup tables, never from a scan of log_entry
+    totals = rollup_totals('day')
+    total_sent = totals.get('success', 0)
+    total_failed = totals.get('failure', 0)
+    total_pending = db.session.query(func.coalesce(func.sum(Campaign.emails_pending), 0)).scalar()
 
     sender_stats = db.session.query(
         SenderEmail.email,
@@ -25,24 +42,46 @@ def dashboard():
         Campaign.name,
         Campaign.status,
         Campaign.total_emails,
+        Campaign.emails_pending,
         Campaign.emails_sent,
         Campaign.emails_failed
     ).all()
 
+    chart_range = request.args.get('chart_range', 'hour')
+    if chart_range not in CHART_RANGES:
+        chart_range = 'hour'
+    chart_campaign = request.args.get('chart_campaign', type=int)
+    chart_sender = request.args.get('chart_sender') or None
+    granularity, window = CHART_RANGES[chart_range]
+    chart = throughput(granularity, datetime.utcnow() - window, campaign_id=chart_campaign, sender_email=chart_sender)
+    chart_peak = max((counts['success'] + counts['failure'] for _, counts in chart), default=0)
+    chart_campaigns = db.session.query(Campaign.id, Campaign.name).order_by(Campaign.id.desc()).all()
+
     # Logs with filters
     logs = LogEntry.query.order_by(LogEntry.timestamp.desc())
 
     filter_status = request.args.get('status')
     filter_sender = request.args.get('sender')
     filter_receiver = request.args.get('receiver')
+    filter_query = request.args.get('q')
 
     if filter_status and filter_status != 'all':
         logs = logs.filter_by(status=filter_status)
+    # Address filters go through the (case-insensitive) log search index; a full
+    # address must then also match exactly, ignoring case
     if filter_sender:
-        logs = logs.filter(LogEntry.sender_email.ilike(f'%{filter_sender}%'))
+        filter_sender = filter_sender.strip()
+        logs = search_logs(logs, filter_sender, ('sender_email',))
+        if is_valid_email(filter_sender):
+            logs = logs.filter(func.lower(LogEntry.sender_email) == filter_sender.lower())
     if filter_receiver:
-        logs = logs.filter(LogEntry.receiver_email.ilike(f'%{filter_receiver}%'))
-    
+        filter_receiver = filter_receiver.strip()
+        logs = search_logs(logs, filter_receiver, ('receiver_email',))
+        if is_valid_email(filter_receiver):
+            logs = logs.filter(func.lower(LogEntry.receiver_email) == filter_receiver.lower())
+    if filter_query:
+        logs = search_logs(logs, filter_query)
+
     logs = logs.limit(100).all() # Limit to last 100 logs for dashboard display
 
     return render_template('dashboard.html', 
@@ -55,42 +94,96 @@ def dashboard():
                            logs=logs,
                            filter_status=filter_status,
                            filter_sender=filter_sender,
-                           filter_receiver=filter_receiver)
+                           filter_receiver=filter_receiver,
+                           filter_query=filter_query,
+                           chart=chart,
+                           chart_peak=chart_peak,
+                           chart_granularity=granularity,
+                           chart_range=chart_range,
+                           chart_campaign=chart_campaign,
+                           chart_sender=chart_sender,
+                           chart_campaigns=chart_campaigns)
 
 @bp.route('/export_logs')
 @login_required
 def export_logs():
-    si = StringIO()
-    cw = csv.writer(si)
-
-    headers = ['Timestamp', 'Level', 'Message', 'Sender Email', 'Receiver Email', 'Status', 'Error Reason']
-    cw.writerow(headers)
-
-    logs = LogEntry.query.order_by(LogEntry.timestamp.asc()).all()
-    for log in logs:
-        cw.writerow([
-            log.timestamp.isoformat(),
-            log.level,
-            log.message,
-            log.sender_email,
-            log.receiver_email,
-            log.status,
-            log.error_reason
-        ])
-    
-    output = si.getvalue()
-    response = Response(output, mimetype='text/csv')
-    response.headers['Content-Disposition'] = 'attachment; filename=email_marketing_logs.csv'
+    # Streams the CSV (optionally gzipped) in id-ordered keyset chunks. Each
+    # chunk is its own short query, so memory stays flat however large
+    # log_entry is and no long read transaction holds up the log writer.
+    logs = LogEntry.__table__
+    query = select(logs).order_by(logs.c.id)
+    try:
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+        until = datetime.fromisoformat(request.args['until']) if request.args.get('until') else None
+    except ValueError:
+        flash('Invalid export time range.', 'danger')
+        return redirect(url_for('dashboard.dashboard'))
+    if since:
+        query = query.where(logs.c.timestamp >= since)
+    if until:
+        query = query.where(logs.c.timestamp < until)
+    campaign_id = request.args.get('campaign_id', type=int)
+    if campaign_id is not None:
+        query = query.where(logs.c.campaign_id == campaign_id)
+    status = request.args.get('status')
+    if status and status != 'all':
+        query = query.where(logs.c.status == status)
+    compress = request.args.get('gzip') == '1'
+    # The stream runs without the request context: it reads through the engine
+    # on its own short connections, and the session login_required used is
+    # handed back now instead of pinning a pooled connection for the download.
+    engine = db.engine
+    db.session.remove()
+
+    def generate():
+        si = StringIO()
+        cw = csv.writer(si)
+        compressor = zlib.compressobj(wbits=31) if compress else None # wbits=31 writes a gzip container
+
+        def take():
+            output = si.getvalue()
+            si.seek(0)
+            si.truncate()
+            return compressor.compress(output.encode('utf-8')) if compressor else output
+
+        headers = ['Timestamp', 'Level', 'Message', 'Sender Email', 'Receiver Email', 'Status', 'Error Reason', 'Campaign ID']
+        cw.writerow(headers)
+        last_id = 0
+        while True:
+            with engine.connect() as conn:
+                rows = conn.execute(query.where(logs.c.id > last_id).limit(EXPORT_CHUNK_SIZE)).all()
+            if not rows:
+                break
+            for log in rows:
+                cw.writerow([
+                    log.timestamp.isoformat() if log.timestamp else '',
+                    log.level,
+                    log.message,
+                    log.sender_email,
+                    log.receiver_email,
+                    log.status,
+                    log.error_reason,
+                    log.campaign_id
+                ])
+            last_id = rows[-1].id
+            yield take()
+        yield take()
+        if compressor:
+            yield compressor.flush()
+
+    filename = 'email_marketing_logs.csv.gz' if compress else 'email_marketing_logs.csv'
+    response = Response(generate(), mimetype='application/gzip' if compress else 'text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
     return response
 
 @bp.route('/clear_logs', methods=['POST'])
 @login_required
 def clear_logs():
+    # Chunked like the retention purge (and archived if LOG_ARCHIVE is on), so
+    # log writers are never locked out for the whole delete
     try:
-        num_deleted = db.session.query(LogEntry).delete()
-        db.session.commit()
+        num_deleted = purge_logs()
         flash(f'{num_deleted} log entries cleared successfully.', 'success')
     except Exception as e:
-        db.session.rollback()
         flash(f'Error clearing logs: {str(e)}', 'danger')
     return redirect(url_for('dashboard.dashboard'))
@@ -1,85 +1,304 @@
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from app import db
-from app.models import SenderEmail, ReceiverEmail, MessageTemplate, LogEntry, Campaign
+from app.models import Campaign
+from app.log_sink import log_sink
+from app.write_behind import status_buffer
+from app.render import render_plans, personalization_fields
+from app.mime import build_message
+from collections import namedtuple
 from datetime import datetime
-import random
 import time
 import threading
 from flask import current_app
 
-def send_email_task_sync(receiver_id, campaign_id, app_instance, sender_id=None, retry_count=0):
-    # This function will run in a separate thread
-    with app_instance.app_context():
-        receiver = ReceiverEmail.query.get(receiver_id)
-        campaign = Campaign.query.get(campaign_id)
-        template = MessageTemplate.query.get(campaign.template_id)
-
-        if not receiver or not campaign or not template:
-            log_event('ERROR', f"Failed to send email: Missing receiver, campaign or template. Receiver ID: {receiver_id}, Campaign ID: {campaign_id}", status='failure')
-            return
-
-        if receiver.status == 'sent':
-            return # Already sent, skip
-
-        sender = None
-        if sender_id:
-            sender = SenderEmail.query.get(sender_id)
-        
-        if not sender:
-            # Rotate sender emails
-            available_senders = SenderEmail.query.filter(
-                SenderEmail.sent_count < SenderEmail.sending_limit
-            ).all()
-            if not available_senders:
-                log_event('ERROR', "No available sender emails with remaining limits.", status='failure', receiver_email=receiver.email)
-                receiver.status = 'failed'
-                db.session.commit()
-                return
+def _close_quietly(smtp):
+    try:
+        smtp.quit()
+    except Exception:
+        try:
+            smtp.close()
+        except Exception:
+            pass
+
+class SMTPConnectionPool:
+    # Keeps authenticated SMTP sessions open per sender (keyed by SenderEmail.id)
+    # so a campaign pays for a handful of TLS handshakes and logins instead of one
+    # per receiver. Sessions are health-checked with NOOP before reuse, replaced on
+    # 421/disconnect, capped per sender and closed once they sit idle too long.
+
+    def __init__(self, app=None):
+        self.host = 'smtp.gmail.com'
+        self.port = 465
+        self.use_ssl = True
+        self.timeout = 30
+        self.max_per_sender = 2
+        self.idle_timeout = 60
+        self.noop_interval = 10
+        self._lock = threading.Condition()
+        self._idle = {} # sender_id -> list of (smtp, fingerprint, last_used)
+        self._open = {} # sender_id -> sessions open for that sender (idle + in use)
+        if app is not None:
+            self.init_app(app)
 
-            sender = random.choice(available_senders)
+    def init_app(self, app):
+        self.host = app.config.get('SMTP_HOST', self.host)
+        self.port = app.config.get('SMTP_PORT', self.port)
+        self.use_ssl = app.config.get('SMTP_USE_SSL', self.use_ssl)
+        self.timeout = app.config.get('SMTP_TIMEOUT', self.timeout)
+        self.max_per_sender = app.config.get('SMTP_POOL_MAX_PER_SENDER', self.max_per_sender)
+        self.idle_timeout = app.config.get('SMTP_POOL_IDLE_TIMEOUT', self.idle_timeout)
+        self.noop_interval = app.config.get('SMTP_POOL_NOOP_INTERVAL', self.noop_interval)
+        app.extensions['smtp_pool'] = self
 
+    def _connect(self, sender):
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
         try:
-            # Personalize message (simple placeholder replacement)
-            personalized_html_body = template.body_html.replace('{name}', receiver.email.split('@')[0]) # Example: use part before @ as name
-            personalized_plain_body = template.body_plain.replace('{name}', receiver.email.split('@')[0]) if template.body_plain else None
+            smtp.ehlo()
+            if smtp.has_extn('auth'): # Local SMTP sinks used for testing usually don't offer AUTH
+                smtp.login(sender.email, sender.password)
+        except Exception:
+            _close_quietly(smtp)
+            raise
+        return smtp
+
+    def _is_alive(self, smtp):
+        try:
+            return smtp.noop()[0] == 250
+        except Exception:
+            return False
 
-            msg = MIMEMultipart('alternative')
-            msg['From'] = sender.email
-            msg['To'] = receiver.email
-            msg['Subject'] = template.subject
+    def _reap_idle(self, now):
+        # Must be called with self._lock held
+        reaped = False
+        for sender_id, idle in self._idle.items():
+            expired = [entry for entry in idle if now - entry[2] > self.idle_timeout]
+            for entry in expired:
+                idle.remove(entry)
+                _close_quietly(entry[0])
+                self._open[sender_id] -= 1
+                reaped = True
+        if reaped:
+            self._lock.notify_all()
 
-            msg.attach(MIMEText(personalized_plain_body, 'plain'))
-            msg.attach(MIMEText(personalized_html_body, 'html'))
+    def _checkout(self, sender):
+        # Sessions are tied to the credentials they were opened with, so an edited
+        # sender never reuses a session logged in with the old email/password.
+        fingerprint = (sender.email, sender._password_encrypted)
+        smtp = None
+        last_used = None
+        with self._lock:
+            while True:
+                now = time.time()
+                self._reap_idle(now)
+                idle = self._idle.setdefault(sender.id, [])
+                while idle:
+                    candidate, candidate_fingerprint, candidate_last_used = idle.pop()
+                    if candidate_fingerprint == fingerprint:
+                        smtp, last_used = candidate, candidate_last_used
+                        break
+                    _close_quietly(candidate)
+                    self._open[sender.id] -= 1
+                if smtp is not None:
+                    break
+                if self._open.get(sender.id, 0) < (sender.max_concurrency or self.max_per_sender):
+                    self._open[sender.id] = self._open.get(sender.id, 0) + 1
+                    break
+                self._lock.wait(self.timeout)
 
-            with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp: # Example for Gmail
-                smtp.login(sender.email, sender.password)
-                smtp.send_message(msg)
-
-            sender.sent_count += 1
-            receiver.status = 'sent'
-            receiver.sent_at = datetime.utcnow()
-            campaign.emails_sent += 1
-            db.session.commit()
-            log_event('INFO', f"Email sent to {receiver.email} from {sender.email}", sender_email=sender.email, receiver_email=receiver.email, status='success')
-
-        except Exception as e:
-            db.session.rollback()
-            error_message = str(e)
-            log_event('ERROR', f"Failed to send email to {receiver.email} from {sender.email}: {error_message}", sender_email=sender.email, receiver_email=receiver.email, status='failure', error_reason=error_message)
-            
-            if retry_count < 3:
-                # Retry after a delay in a new thread
-                time.sleep(5 * (retry_count + 1)) # 5, 10, 15 seconds delay
-                threading.Thread(target=send_email_task_sync, args=(receiver_id, campaign_id, app_instance, sender.id, retry_count + 1)).start()
+        if smtp is not None and time.time() - last_used > self.noop_interval and not self._is_alive(smtp):
+            _close_quietly(smtp)
+            smtp = None
+        if smtp is None:
+            try:
+                smtp = self._connect(sender)
+            except Exception:
+                self._release_slot(sender.id)
+                raise
+        return smtp, fingerprint
+
+    def _checkin(self, sender_id, smtp, fingerprint):
+        with self._lock:
+            self._idle.setdefault(sender_id, []).append((smtp, fingerprint, time.time()))
+            self._lock.notify()
+
+    def _release_slot(self, sender_id):
+        with self._lock:
+            self._open[sender_id] -= 1
+            self._lock.notify()
+
+    def _discard(self, sender_id, smtp):
+        _close_quietly(smtp)
+        self._release_slot(sender_id)
+
+    def send_message(self, sender, msg):
+        self._deliver(sender, lambda smtp: smtp.send_message(msg))
+
+    def sendmail(self, sender, to_addrs, raw):
+        # `raw` is a fully encoded message with CRLF line endings, sent as is
+        self._deliver(sender, lambda smtp: smtp.sendmail(sender.email, to_addrs, raw))
+
+    def _deliver(self, sender, send):
+        # A pooled session can be dropped by the server between messages; when that
+        # shows up as a disconnect or a 421 we reconnect once and resend.
+        for attempt in range(2):
+            smtp, fingerprint = self._checkout(sender)
+            try:
+                send(smtp)
+            except smtplib.SMTPServerDisconnected:
+                self._discard(sender.id, smtp)
+                if attempt:
+                    raise
+            except smtplib.SMTPResponseException as e:
+                if e.smtp_code == 421:
+                    self._discard(sender.id, smtp)
+                    if attempt:
+                        raise
+                else:
+                    self._checkin(sender.id, smtp, fingerprint) # smtplib already sent RSET, session is reusable
+                    raise
+            except smtplib.SMTPRecipientsRefused:
+                self._checkin(sender.id, smtp, fingerprint)
+                raise
+            except Exception:
+                self._discard(sender.id, smtp)
+                raise
             else:
-                receiver.status = 'failed'
-                campaign.emails_failed += 1
-                db.session.commit()
-
-# Helper to save logs (can be called from anywhere)
-def log_event(level, message, sender_email=None, receiver_email=None, status=None, error_reason=None):
-    log = LogEntry(level=level, message=message, sender_email=sender_email, receiver_email=receiver_email, status=status, error_reason=error_reason)
-    db.session.add(log)
-    db.session.commit()
+                self._checkin(sender.id, smtp, fingerprint)
+                return
+
+    def close_idle(self, sender_id=None):
+        # Close idle sessions for one sender, or for all senders when no id is given
+        with self._lock:
+            sender_ids = [sender_id] if sender_id is not None else list(self._idle)
+            for key in sender_ids:
+                for smtp, _, _ in self._idle.pop(key, []):
+                    _close_quietly(smtp)
+                    self._open[key] -= 1
+            self._lock.notify_all()
+
+smtp_pool = SMTPConnectionPool()
+
+def classify_smtp_error(exc):
+    # 'permanent' means the receiver or message was rejected (5xx) and another
+    # attempt can't succeed. Everything else (4xx, timeouts, dropped connections,
+    # a sender failing to log in or being refused) is 'transient' and retried.
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in exc.recipients.values()]
+        return 'permanent' if codes and all(500 <= code < 600 for code in codes) else 'transient'
+    if isinstance(exc, (smtplib.SMTPAuthenticationError, smtplib.SMTPSenderRefused)):
+        return 'transient' # A problem with this sender; a different one may get through
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 'permanent' if 500 <= exc.smtp_code < 600 else 'transient'
+    return 'transient'
+
+def sender_trouble(exc):
+    # What a failed send says about the sender itself: 'auth' when it cannot log
+    # in, 'cooldown' when its server refuses it or can't be reached, None when
+    # the failure is about the message or the recipient.
+    if isinstance(exc, smtplib.SMTPAuthenticationError):
+        return 'auth'
+    if isinstance(exc, (smtplib.SMTPSenderRefused, smtplib.SMTPConnectError, smtplib.SMTPServerDisconnected)):
+        return 'cooldown'
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 'cooldown' if exc.smtp_code in (421, 454) else None
+    if isinstance(exc, smtplib.SMTPException):
+        return None
+    if isinstance(exc, OSError):
+        return 'cooldown' # Connection refused, timeouts, TLS failures
+    return None
+
+class CampaignSendContext(namedtuple('CampaignSendContext', 'campaign_id campaign_name plan sender_pool retry_max_attempts cooldown_seconds')):
+    # What every message of a campaign run needs, read once when the run starts:
+    # campaign settings, the template's render plan and the run's SenderPool.
+    # Immutable, so the send threads share one instance; sends made with it
+    # read nothing from the DB. A template edited mid-run applies to the next run.
+    __slots__ = ()
+
+    @classmethod
+    def load(cls, campaign_id, app_instance, sender_pool=None):
+        # Needs an app context. Returns None if the campaign or its template is gone.
+        campaign = db.session.get(Campaign, campaign_id)
+        plan = render_plans.get(campaign.template_id) if campaign and campaign.template_id else None
+        if not campaign or not plan:
+            return None
+        return cls(campaign.id, campaign.name, plan, sender_pool,
+                   app_instance.config.get('RETRY_MAX_ATTEMPTS', 3),
+                   app_instance.config.get('SENDER_COOLDOWN_SECONDS', 60))
+
+def send_to_receiver(context, receiver_id, receiver_email, retry_count=0, signal=None):
+    # Sends one message of a campaign run. Returns 'sent', 'failed' or 'retry';
+    # it never retries by itself. Returns None, leaving the receiver unsent,
+    # when the run's `signal` is paused or stopped before the message goes out,
+    # including while it waits for a sender's cooldown or rate budget.
+    # Rotate sender emails: least-loaded sender with quota and rate budget left
+    sender = context.sender_pool.acquire(signal)
+    if signal is not None and signal.is_halted():
+        if sender:
+            context.sender_pool.release(sender, False)
+        return None
+    if not sender:
+        log_event('ERROR', "No available sender emails with remaining limits.", status='failure', receiver_email=receiver_email, campaign_id=context.campaign_id)
+        status_buffer.record_failed(receiver_id, context.campaign_id)
+        return 'failed'
+
+    sent = False
+    try:
+        # Personalize message from the template's cached render plan
+        plan = context.plan
+        fields = personalization_fields(receiver_email, context.campaign_name)
+        raw = plan.skeleton.render(fields, sender.email, receiver_email)
+        if raw is not None:
+            smtp_pool.sendmail(sender, [receiver_email], raw)
+        else:
+            smtp_pool.send_message(sender, build_message(plan, fields, sender.email, receiver_email))
+
+        # Status and counters are written in batches by the write-behind buffer
+        status_buffer.record_sent(receiver_id, sender.id, context.campaign_id, datetime.utcnow())
+        log_event('INFO', f"Email sent to {receiver_email} from {sender.email}", sender_email=sender.email, receiver_email=receiver_email, status='success', campaign_id=context.campaign_id)
+        sent = True
+        return 'sent'
+
+    except Exception as e:
+        error_message = str(e)
+        log_event('ERROR', f"Failed to send email to {receiver_email} from {sender.email}: {error_message}", sender_email=sender.email, receiver_email=receiver_email, status='failure', error_reason=error_message, campaign_id=context.campaign_id)
+
+        trouble = sender_trouble(e)
+        if trouble == 'auth':
+            context.sender_pool.disable(sender) # Out of rotation for the rest of this run
+            log_event('WARNING', f"Sender {sender.email} failed to authenticate and was taken out of rotation.", sender_email=sender.email, campaign_id=context.campaign_id)
+        elif trouble == 'cooldown':
+            context.sender_pool.cool_down(sender, context.cooldown_seconds)
+
+        if classify_smtp_error(e) == 'transient' and retry_count < context.retry_max_attempts:
+            return 'retry' # Receiver stays claimed; the caller schedules it again with backoff
+
+        status_buffer.record_failed(receiver_id, context.campaign_id)
+        return 'failed'
+
+    finally:
+        context.sender_pool.release(sender, sent)
+
+def send_batch(context, receivers, app_instance, retry_count=0, signal=None):
+    # Sends to a list of (id, email) receivers one after another on the calling
+    # thread, so a campaign run pays one executor hop and one app context per
+    # batch instead of per message. Returns [(receiver, outcome), ...]; once
+    # the run's `signal` is paused or stopped the rest are left unsent with
+    # outcome None.
+    outcomes = []
+    with app_instance.app_context():
+        for position, receiver in enumerate(receivers):
+            if signal is not None and signal.is_halted():
+                outcomes.extend((unsent, None) for unsent in receivers[position:])
+                break
+            outcomes.append((receiver, send_to_receiver(context, receiver[0], receiver[1], retry_count, signal)))
+    return outcomes
+
+# Helper to save logs (can be called from anywhere). Entries are queued and
+# written in batches by the background log sink, not in the caller's session.
+def log_event(level, message, sender_email=None, receiver_email=None, status=None, error_reason=None, campaign_id=None):
+    log_sink.emit({'timestamp': datetime.utcnow(), 'level': level, 'message': message, 'sender_email': sender_email,
+                   'receiver_email': receiver_email, 'status': status, 'error_reason': error_reason,
+                   'campaign_id': campaign_id})
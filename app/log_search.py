@@ -0,0 +1,37 @@
+from sqlalchemy import column, inspect, literal_column, or_, select, table
+from app import db
+from app.models import LogEntry
+
+# Indexed substring search over log entries. On SQLite it goes through the
+# log_entry_fts FTS5 table (trigram tokenizer, kept in sync by triggers); on
+# Postgres through pg_trgm GIN indexes, which serve ILIKE '%term%' directly.
+# Both are created by the add_log_search_indexes migration. Terms shorter than
+# a trigram, or databases without the index, fall back to a plain ILIKE.
+
+SEARCH_COLUMNS = ('message', 'sender_email', 'receiver_email', 'error_reason')
+MIN_INDEXED_LENGTH = 3
+
+_log_entry_fts = table('log_entry_fts', column('rowid'))
+_has_fts = {}
+
+def _fts_available():
+    key = str(db.engine.url)
+    if key not in _has_fts:
+        _has_fts[key] = inspect(db.engine).has_table('log_entry_fts')
+    return _has_fts[key]
+
+def _fts_phrase(term, columns):
+    return '{%s} : "%s"' % (' '.join(columns), term.replace('"', '""'))
+
+def search_logs(query, term, columns=SEARCH_COLUMNS):
+    # Restricts a LogEntry query to entries containing `term`, ignoring case,
+    # in any of `columns`
+    term = term.strip()
+    if not term:
+        return query
+    if db.engine.dialect.name == 'sqlite' and len(term) >= MIN_INDEXED_LENGTH and _fts_available():
+        matches = select(_log_entry_fts.c.rowid) \
+            .where(literal_column('log_entry_fts').op('MATCH')(_fts_phrase(term, columns)))
+        return query.filter(LogEntry.id.in_(matches))
+    pattern = '%' + term.replace('/', '//').replace('%', '/%').replace('_', '/_') + '%'
+    return query.filter(or_(*[getattr(LogEntry, name).ilike(pattern, escape='/') for name in columns]))
@@ -0,0 +1,129 @@
+import atexit
+import json
+import os
+import queue
+import threading
+from datetime import datetime
+from sqlalchemy import insert
+from app import db
+from app.models import LogEntry
+from app.rollups import apply_rollup_counts, count_records
+
+class LogSink:
+    # Background writer for LogEntry rows. log_event only puts a record on a
+    # bounded in-memory queue; a writer thread drains it and inserts batches
+    # with a single executemany, outside the senders' sessions. When the DB
+    # falls behind and the queue fills up, LOG_BACKPRESSURE decides what happens:
+    #   'block'     - the caller waits for room (nothing is lost)
+    #   'drop_info' - INFO records are dropped, everything else waits
+    #   'spill'     - records go to a local JSON-lines file and are replayed
+    #                 into the DB once the writer catches up
+    # Each batch also updates the dashboard rollups in the same transaction.
+
+    def __init__(self, app=None):
+        self.app = None
+        self.batch_size = 500
+        self.interval = 0.5
+        self.policy = 'block'
+        self.spill_path = None
+        self.dropped = 0
+        self._queue = queue.Queue(10000)
+        self._write_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config.get('LOG_BATCH_SIZE', self.batch_size)
+        self.interval = app.config.get('LOG_FLUSH_INTERVAL_MS', self.interval * 1000) / 1000.0
+        self.policy = app.config.get('LOG_BACKPRESSURE', self.policy)
+        self.spill_path = app.config.get('LOG_SPILL_PATH') or os.path.join(app.instance_path, 'log_spill.jsonl')
+        self._queue = queue.Queue(app.config.get('LOG_QUEUE_SIZE', 10000))
+        app.extensions['log_sink'] = self
+        atexit.register(self.flush) # Write out whatever is still queued on shutdown
+
+    def _start_writer(self):
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._drain_forever, name='log-sink', daemon=True)
+                self._writer.start()
+
+    def emit(self, record):
+        self._start_writer()
+        try:
+            self._queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if self.policy == 'spill':
+            self._spill([record])
+        elif self.policy == 'drop_info' and record.get('level') == 'INFO':
+            self.dropped += 1
+        else:
+            self._queue.put(record)
+
+    def _take_batch(self, timeout=None):
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait())
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _drain_forever(self):
+        while True:
+            batch = self._take_batch(timeout=self.interval)
+            with self._write_lock:
+                if batch:
+                    self._write(batch)
+                else:
+                    self._replay_spill() # Idle: catch up on anything spilled earlier
+
+    def flush(self):
+        # Synchronously writes everything queued so far
+        with self._write_lock:
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    break
+                self._write(batch)
+
+    def _write(self, batch):
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as conn:
+                    conn.execute(insert(LogEntry.__table__), batch)
+                    apply_rollup_counts(conn, count_records(batch))
+        except Exception:
+            self.app.logger.exception(f"Failed to write {len(batch)} log entries, spilling them to {self.spill_path}")
+            self._spill(batch)
+
+    def _spill(self, records):
+        with self._spill_lock:
+            os.makedirs(os.path.dirname(self.spill_path) or '.', exist_ok=True)
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, default=lambda value: value.isoformat()) + '\n')
+
+    def _replay_spill(self):
+        # Must be called with self._write_lock held
+        with self._spill_lock:
+            if not os.path.exists(self.spill_path):
+                return
+            replaying_path = self.spill_path + '.replaying'
+            os.replace(self.spill_path, replaying_path)
+        with open(replaying_path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        for record in records:
+            record['timestamp'] = datetime.fromisoformat(record['timestamp'])
+            record.setdefault('campaign_id', None) # Spilled before log records carried it
+        for i in range(0, len(records), self.batch_size):
+            self._write(records[i:i + self.batch_size])
+        os.remove(replaying_path)
+
+log_sink = LogSink()
@@ -1,4 +1,4 @@
-from flask import render_template
+from flask import redirect, url_for
 from flask_login import login_required
 from app.main import bp
 
@@ -6,4 +6,5 @@ from app.main import bp
 @bp.route('/dashboard')
 @login_required
 def dashboard():
-    return render_template('dashboard.html', title='Dashboard')
+    # dashboard.html needs the stats, chart and logs the dashboard blueprint builds
+    return redirect(url_for('dashboard.dashboard'))
@@ -0,0 +1,104 @@
+import base64
+import re
+from email.generator import BytesGenerator, _make_boundary
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.policy import compat32
+from io import BytesIO
+
+# Pre-encoded message skeletons. The MIME structure, part headers and static
+# body text of a template version are encoded once; each message is then the
+# skeleton's bytes with the From/To/Subject headers and the personalized
+# values spliced in, ready for smtplib's sendmail. The skeleton is checked
+# against the MIMEMultipart build when it is created, and render() returns None
+# for any message it cannot produce byte for byte the same (callers then fall
+# back to build_message).
+
+_POLICY = compat32.clone(linesep='\r\n') # What smtplib's send_message flattens with
+_SLOT_PATTERN = re.compile(rb'\x00(\d+)\x00')
+_SENTINEL = '\x00%d\x00'
+
+def build_message(plan, fields, sender_email, receiver_email, boundary=None):
+    msg = MIMEMultipart('alternative', boundary=boundary)
+    msg['From'] = sender_email
+    msg['To'] = receiver_email
+    msg['Subject'] = plan.subject.render(fields)
+    if plan.plain:
+        msg.attach(MIMEText(plan.plain.render(fields), 'plain'))
+    msg.attach(MIMEText(plan.html.render(fields), 'html'))
+    return msg
+
+def flatten(msg):
+    fp = BytesIO()
+    BytesGenerator(fp).flatten(msg, linesep='\r\n')
+    return fp.getvalue()
+
+class MessageSkeleton:
+    def __init__(self, plan):
+        self.plan = plan
+        self.boundary = _make_boundary()
+        self.enabled = True
+        # A part whose static text is ASCII goes out as 7bit us-ascii, so each
+        # placeholder is its own slot. Any other part is base64 UTF-8 and the
+        # whole encoded body is one slot.
+        self._slots = []
+        msg = MIMEMultipart('alternative', boundary=self.boundary)
+        for subtype, part_plan in (('plain', plan.plain), ('html', plan.html)):
+            if part_plan is None:
+                continue
+            statics = [segment for segment in part_plan.segments if segment is not None]
+            if any(self.boundary in segment for segment in statics):
+                self.enabled = False
+                return
+            if all(segment.isascii() and '\x00' not in segment for segment in statics):
+                fields = dict(part_plan.slots)
+                text = ''.join(segment if segment is not None else _SENTINEL % self._add_slot(('field', fields[index]))
+                               for index, segment in enumerate(part_plan.segments))
+                msg.attach(MIMEText(text, subtype))
+            else:
+                part = MIMEText('', subtype, 'utf-8') # Content-Type/CTE headers of a UTF-8 part
+                part.set_payload(_SENTINEL % self._add_slot(('base64', part_plan)) + '\n')
+                msg.attach(part)
+        head, _, body = flatten(msg).partition(b'\r\n\r\n')
+        self._head = head + b'\r\n'
+        self._body = _SLOT_PATTERN.split(body) # static, slot index, static, ...
+
+        sample = {'name': 'skeleton.check', 'email': 'skeleton.check@example.com', 'domain': 'example.com', 'campaign': 'Campaign'}
+        expected = flatten(build_message(plan, sample, 'sender@example.com', sample['email'], boundary=self.boundary))
+        self.enabled = self.render(sample, 'sender@example.com', sample['email']) == expected
+
+    def _add_slot(self, slot):
+        self._slots.append(slot)
+        return len(self._slots) - 1
+
+    def _field_bytes(self, value):
+        # Values dropped into 7bit text must not change how it is generated
+        if not value.isascii() or '\r' in value or '\n' in value or self.boundary in value:
+            return None
+        return value.encode('ascii')
+
+    def render(self, fields, sender_email, receiver_email):
+        if not self.enabled or not sender_email.isascii() or not receiver_email.isascii():
+            return None
+        parts = [self._head,
+                 _POLICY.fold_binary('From', sender_email),
+                 _POLICY.fold_binary('To', receiver_email),
+                 _POLICY.fold_binary('Subject', self.plan.subject.render(fields)),
+                 b'\r\n']
+        for position, chunk in enumerate(self._body):
+            if position % 2 == 0:
+                parts.append(chunk)
+                continue
+            kind, value = self._slots[int(chunk)]
+            if kind == 'field':
+                encoded = self._field_bytes(fields[value])
+            else:
+                # Same 76-column lines as email.base64mime, minus the final line break kept in the skeleton
+                encoded = base64.encodebytes(value.render(fields).encode('utf-8')).replace(b'\n', b'\r\n')[:-2] or None
+            if encoded is None:
+                return None
+            parts.append(encoded)
+        raw = b''.join(parts)
+        if b'\r\nFrom ' in raw:
+            return None # The generator would have escaped that line as '>From '
+        return raw
@@ -3,6 +3,7 @@ from app import db, login_manager
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from cryptography.fernet import Fernet
+from app.credentials import credential_cache
 import os
 
 # Generate a key for Fernet encryption. In a real application, this should be loaded from a secure environment variable.
@@ -15,6 +16,9 @@ else:
 
 cipher_suite = Fernet(FERNET_KEY.encode('utf-8'))
 
+def decrypt_password(token):
+    return cipher_suite.decrypt(token).decode('utf-8')
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
@@ -35,21 +39,52 @@ class SenderEmail(db.Model):
     _password_encrypted = db.Column(db.LargeBinary, nullable=False)
     sent_count = db.Column(db.Integer, default=0)
     sending_limit = db.Column(db.Integer, default=500) # Default limit
+    max_concurrency = db.Column(db.Integer, nullable=True) # Parallel SMTP sessions, falls back to SMTP_POOL_MAX_PER_SENDER
+    rate_per_minute = db.Column(db.Integer, default=60) # Token bucket refill rate, 0 means unlimited
+    rate_burst = db.Column(db.Integer, default=1) # Token bucket size
 
     @property
     def password(self):
-        return cipher_suite.decrypt(self._password_encrypted).decode('utf-8')
+        return credential_cache.get(self.id, self._password_encrypted, decrypt_password)
 
     @password.setter
     def password(self, plaintext_password):
         self._password_encrypted = cipher_suite.encrypt(plaintext_password.encode('utf-8'))
 
 class ReceiverEmail(db.Model):
+    __table_args__ = (
+        # One receiver per address per campaign; rows that predate this index may be NULL
+        db.Index('ix_receiver_email_campaign_id_normalized_email', 'campaign_id', 'normalized_email', unique=True),
+        # Keyset pagination of a campaign's receivers, with and without a status filter
+        db.Index('ix_receiver_email_campaign_id_status_id', 'campaign_id', 'status', 'id'),
+        db.Index('ix_receiver_email_campaign_id_id', 'campaign_id', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), nullable=False)
-    status = db.Column(db.String(20), default='pending') # pending, sent, failed
+    normalized_email = db.Column(db.String(120), nullable=True) # Lower-cased address used for de-duplication
+    status = db.Column(db.String(20), default='pending') # pending, claimed, sent, failed
     sent_at = db.Column(db.DateTime, nullable=True)
     campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), nullable=True)
+    claimed_by = db.Column(db.String(64), nullable=True) # Worker holding a 'claimed' receiver (app.claims)
+    lease_expires_at = db.Column(db.DateTime, nullable=True) # The claim goes back to pending after this
+
+class ReceiverImport(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    stored_path = db.Column(db.String(512), nullable=False) # Upload saved until the background job has read it
+    email_column = db.Column(db.String(100), nullable=True) # CSV header to read addresses from
+    status = db.Column(db.String(20), default='queued') # queued, running, completed, failed
+    total_bytes = db.Column(db.BigInteger, default=0)
+    bytes_read = db.Column(db.BigInteger, default=0)
+    rows_read = db.Column(db.Integer, default=0)
+    rows_imported = db.Column(db.Integer, default=0)
+    rows_duplicate = db.Column(db.Integer, default=0)
+    rows_invalid = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
 
 class MessageTemplate(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -58,8 +93,16 @@ class MessageTemplate(db.Model):
     body_html = db.Column(db.Text, nullable=False)
     body_plain = db.Column(db.Text, nullable=True)
     is_active = db.Column(db.Boolean, default=False)
+    version = db.Column(db.Integer, nullable=False, default=1) # Bumped on every edit, keys the compiled render plan cache
 
 class LogEntry(db.Model):
+    __table_args__ = (
+        # Exact filters on the dashboard, which lists the newest entries first
+        db.Index('ix_log_entry_status_timestamp', 'status', 'timestamp'),
+        db.Index('ix_log_entry_sender_email_timestamp', 'sender_email', 'timestamp'),
+        db.Index('ix_log_entry_receiver_email_timestamp', 'receiver_email', 'timestamp'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     level = db.Column(db.String(20)) # INFO, WARNING, ERROR
@@ -68,6 +111,27 @@ class LogEntry(db.Model):
     receiver_email = db.Column(db.String(120), nullable=True)
     status = db.Column(db.String(20), nullable=True) # success, failure
     error_reason = db.Column(db.Text, nullable=True)
+    campaign_id = db.Column(db.Integer, nullable=True) # No foreign key: logs outlive deleted campaigns
+
+class LogRollup(db.Model):
+    # Event counts per time bucket, kept up to date by the log sink as entries
+    # are written. '' and 0 stand for "none" so the unique index can be upserted.
+    __table_args__ = (
+        db.Index('ix_log_rollup_bucket', 'granularity', 'bucket_start', 'sender_email', 'campaign_id', 'status', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False) # minute, hour, day
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    sender_email = db.Column(db.String(120), nullable=False, default='')
+    campaign_id = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False, default='')
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class RateLimitBucket(db.Model):
+    key = db.Column(db.String(64), primary_key=True) # 'sender:<id>' or 'global'
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False) # Unix time of the last refill
 
 class TelegramSettings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -89,8 +153,10 @@ class Campaign(db.Model):
     started_at = db.Column(db.DateTime, nullable=True)
     completed_at = db.Column(db.DateTime, nullable=True)
     total_emails = db.Column(db.Integer, default=0)
+    emails_pending = db.Column(db.Integer, default=0)
     emails_sent = db.Column(db.Integer, default=0)
     emails_failed = db.Column(db.Integer, default=0)
     template_id = db.Column(db.Integer, db.ForeignKey('message_template.id'), nullable=True)
+    send_concurrency = db.Column(db.Integer, nullable=True) # In-flight sends, falls back to SEND_CONCURRENCY
 
     receivers = db.relationship('ReceiverEmail', backref='campaign', lazy='dynamic')
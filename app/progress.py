@@ -0,0 +1,130 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+from sqlalchemy import select
+from app import db
+from app.models import Campaign
+from app.write_behind import status_buffer
+
+# Live campaign progress for the Server-Sent Events stream. While anyone is
+# subscribed, one thread per process takes a snapshot of every campaign each
+# `interval` seconds (one counter query shared by all connections, plus the
+# sent/failed counts the send engine has recorded in this process' write-behind
+# buffer but not flushed yet), derives the send rate and ETA, and pushes only
+# the campaigns that changed to each subscriber's queue.
+
+def campaign_progress(row, sent=0, failed=0):
+    # Status and counters of a campaign row, plus sent/failed not yet flushed
+    emails_sent = row.emails_sent + sent
+    emails_failed = row.emails_failed + failed
+    emails_pending = max(0, row.emails_pending - sent - failed)
+    return {'status': row.status, 'total_emails': row.total_emails, 'emails_sent': emails_sent,
+            'emails_failed': emails_failed, 'emails_pending': emails_pending,
+            'progress': (emails_sent / row.total_emails * 100) if row.total_emails > 0 else 0}
+
+class ProgressHub:
+
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = 1.0
+        self.rate_window = 30.0
+        self.queue_size = 100
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._publisher = None
+        self._latest = {} # campaign_id -> progress dict last pushed
+        self._samples = {} # campaign_id -> deque of (monotonic time, sent + failed)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('PROGRESS_INTERVAL', self.interval)
+        self.rate_window = app.config.get('PROGRESS_RATE_WINDOW', self.rate_window)
+        app.extensions['progress_hub'] = self
+
+    def subscribe(self):
+        # Returns a queue of JSON payloads ({campaign_id: progress}); the first
+        # one holds every campaign. None means the subscriber fell too far
+        # behind and was dropped (the client reconnects and starts over).
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            if self._latest:
+                subscriber.put(json.dumps(self._latest))
+            self._subscribers.add(subscriber)
+            if self._publisher is None or not self._publisher.is_alive():
+                self._publisher = threading.Thread(target=self._publish_periodically, name='campaign-progress', daemon=True)
+                self._publisher.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def snapshot(self):
+        # Progress of every campaign, with send rate (per minute) and ETA (seconds)
+        table = Campaign.__table__
+        query = select(table.c.id, table.c.status, table.c.total_emails, table.c.emails_sent,
+                       table.c.emails_failed, table.c.emails_pending)
+        def read():
+            with self.app.app_context(), db.engine.connect() as conn:
+                return conn.execute(query).all()
+        rows, sent, failed = status_buffer.read_counters(read)
+        now = time.monotonic()
+        progress = {}
+        for row in rows:
+            campaign = campaign_progress(row, sent[row.id], failed[row.id])
+            samples = self._samples.setdefault(row.id, deque())
+            samples.append((now, campaign['emails_sent'] + campaign['emails_failed']))
+            while len(samples) > 2 and now - samples[1][0] >= self.rate_window:
+                samples.popleft()
+            elapsed = now - samples[0][0]
+            rate = (samples[-1][1] - samples[0][1]) / elapsed if elapsed > 0 else 0.0
+            campaign['rate_per_minute'] = round(rate * 60, 1)
+            campaign['eta_seconds'] = round(campaign['emails_pending'] / rate) if rate > 0 and campaign['status'] == 'running' else None
+            progress[str(row.id)] = campaign
+        for campaign_id in set(self._samples) - {row.id for row in rows}:
+            del self._samples[campaign_id]
+        return progress
+
+    def _publish_periodically(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._publisher = None
+                    self._latest = {}
+                    self._samples = {}
+                    return
+            try:
+                progress = self.snapshot()
+            except Exception:
+                self.app.logger.exception("Failed to read campaign progress")
+                time.sleep(self.interval)
+                continue
+            with self._lock:
+                first = not self._latest
+                changed = {campaign_id: campaign for campaign_id, campaign in progress.items()
+                           if self._latest.get(campaign_id) != campaign}
+                self._latest = progress
+                if changed:
+                    payload = json.dumps(progress if first else changed)
+                    for subscriber in list(self._subscribers):
+                        try:
+                            subscriber.put_nowait(payload)
+                        except queue.Full:
+                            self._subscribers.discard(subscriber)
+                            self._drop(subscriber)
+            time.sleep(self.interval)
+
+    def _drop(self, subscriber):
+        # Must be called with self._lock held; makes room for the None marker
+        try:
+            while True:
+                subscriber.get_nowait()
+        except queue.Empty:
+            pass
+        subscriber.put_nowait(None)
+
+progress_hub = ProgressHub()
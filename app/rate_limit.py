@@ -0,0 +1,87 @@
+import time
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import RateLimitBucket
+
+class _BucketConflict(Exception):
+    pass
+
+class TokenBucketLimiter:
+    # Token buckets per sender (SenderEmail.rate_per_minute / rate_burst) plus an
+    # optional global bucket. Bucket state lives in the rate_limit_bucket table
+    # and is updated with compare-and-swap, so every worker process draws from
+    # the same budget instead of each getting its own.
+
+    def __init__(self, app=None):
+        self.global_rate_per_minute = 0
+        self.global_burst = 1
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.global_rate_per_minute = app.config.get('GLOBAL_RATE_PER_MINUTE', self.global_rate_per_minute)
+        self.global_burst = app.config.get('GLOBAL_RATE_BURST', self.global_burst)
+        app.extensions['rate_limiter'] = self
+
+    def _limits_for(self, sender):
+        limits = []
+        if sender.rate_per_minute:
+            limits.append((f'sender:{sender.id}', sender.rate_per_minute, sender.rate_burst or 1))
+        if self.global_rate_per_minute:
+            limits.append(('global', self.global_rate_per_minute, self.global_burst))
+        return limits
+
+    def _try_take(self, limits):
+        # Takes one token from every bucket in `limits` or from none of them.
+        # Returns 0 on success, otherwise the seconds until a token is available.
+        table = RateLimitBucket.__table__
+        now = time.time()
+        with db.engine.begin() as conn:
+            rows = {row.key: row for row in conn.execute(
+                select(table.c.key, table.c.tokens, table.c.updated_at)
+                .where(table.c.key.in_([key for key, _, _ in limits])))}
+            wait = 0.0
+            changes = []
+            for key, rate_per_minute, burst in limits:
+                per_second = rate_per_minute / 60.0
+                row = rows.get(key)
+                if row is None:
+                    available = float(burst)
+                else:
+                    available = min(float(burst), row.tokens + max(0.0, now - row.updated_at) * per_second)
+                if available < 1:
+                    wait = max(wait, (1 - available) / per_second)
+                changes.append((key, available - 1, row.updated_at if row is not None else None))
+            if wait:
+                return wait
+
+            for key, tokens, previous_updated_at in changes:
+                if previous_updated_at is None:
+                    conn.execute(insert(table).values(key=key, tokens=tokens, updated_at=now))
+                    continue
+                result = conn.execute(update(table)
+                                      .where(table.c.key == key, table.c.updated_at == previous_updated_at)
+                                      .values(tokens=tokens, updated_at=now))
+                if result.rowcount != 1:
+                    raise _BucketConflict(key) # Another worker took a token first; roll back and re-read
+        return 0.0
+
+    def try_acquire(self, sender):
+        limits = self._limits_for(sender)
+        if not limits:
+            return 0.0
+        try:
+            return self._try_take(limits)
+        except (_BucketConflict, IntegrityError):
+            return 0.001
+
+    def acquire(self, sender):
+        # Blocks until `sender` (and the global budget) allow one more message
+        while True:
+            wait = self.try_acquire(sender)
+            if wait <= 0:
+                return
+            time.sleep(min(wait, 1.0))
+
+rate_limiter = TokenBucketLimiter()
@@ -0,0 +1,181 @@
+import csv
+import gzip
+import io
+import os
+import re
+import uuid
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import insert, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.utils import secure_filename
+from app import db
+from app.models import ReceiverEmail, ReceiverImport
+from app.counters import campaign_counter_update
+
+ALLOWED_EXTENSIONS = ('.txt', '.csv', '.txt.gz', '.csv.gz')
+
+# Syntactic check only (dot-atom local part, dotted hostname); anything it
+# rejects would bounce at SMTP time after costing a send slot and retries
+_ATOM = r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+"
+_LABEL = r"[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?"
+EMAIL_PATTERN = re.compile(rf"{_ATOM}(?:\.{_ATOM})*@{_LABEL}(?:\.{_LABEL})*\.[A-Za-z]{{2,63}}")
+
+def normalize_email(address):
+    return address.strip().lower()
+
+def is_valid_email(address):
+    if len(address) > 120: # ReceiverEmail.email column size
+        return False
+    local_part, _, _ = address.partition('@')
+    return len(local_part) <= 64 and EMAIL_PATTERN.fullmatch(address) is not None
+
+def _insert_ignoring_duplicates(conn):
+    # Concurrent imports into the same campaign can still race past the lookup
+    # in add_receivers; let the unique index drop those rows instead of failing
+    table = ReceiverEmail.__table__
+    if conn.dialect.name == 'postgresql':
+        return postgresql_insert(table).on_conflict_do_nothing()
+    if conn.dialect.name == 'sqlite':
+        return sqlite_insert(table).on_conflict_do_nothing()
+    return insert(table)
+
+def add_receivers(conn, campaign_id, addresses):
+    # Validates and de-duplicates `addresses`, then bulk inserts the new ones
+    # and adds them to the campaign's counters in the same transaction.
+    # Duplicates inside the batch are caught with a hash set and duplicates of
+    # receivers already in the campaign with one lookup on the unique
+    # (campaign_id, normalized_email) index, so memory is bounded by the batch
+    # size however large the file is. Returns (added, duplicates, invalid).
+    table = ReceiverEmail.__table__
+    duplicates = invalid = 0
+    batch = {}
+    for address in addresses:
+        if not is_valid_email(address):
+            invalid += 1
+            continue
+        normalized = normalize_email(address)
+        if normalized in batch:
+            duplicates += 1
+            continue
+        batch[normalized] = address
+    if not batch:
+        return 0, duplicates, invalid
+
+    existing = set(conn.execute(select(table.c.normalized_email)
+                                .where(table.c.campaign_id == campaign_id,
+                                       table.c.normalized_email.in_(list(batch)))).scalars())
+    rows = [{'email': address, 'normalized_email': normalized, 'campaign_id': campaign_id, 'status': 'pending'}
+            for normalized, address in batch.items() if normalized not in existing]
+    inserted = 0
+    if rows:
+        statement = _insert_ignoring_duplicates(conn)
+        if conn.dialect.name in ('postgresql', 'sqlite'):
+            # Rows the unique index dropped return nothing, so count what came back
+            inserted = len(conn.execute(statement.returning(table.c.id), rows).all())
+        else:
+            conn.execute(statement, rows)
+            inserted = len(rows)
+        if inserted:
+            conn.execute(campaign_counter_update(campaign_id, pending=inserted))
+    return inserted, duplicates + len(existing) + len(rows) - inserted, invalid
+
+def allowed_upload(filename):
+    return filename.lower().endswith(ALLOWED_EXTENSIONS)
+
+def save_upload(file, campaign_id, email_column=None):
+    # Streams the upload to disk so the request can return right away; the
+    # background import reads it from there
+    folder = current_app.config.get('IMPORT_UPLOAD_FOLDER') or os.path.join(current_app.instance_path, 'imports')
+    os.makedirs(folder, exist_ok=True)
+    stored_path = os.path.join(folder, f'{uuid.uuid4().hex}-{secure_filename(file.filename)}')
+    file.save(stored_path)
+
+    receiver_import = ReceiverImport(campaign_id=campaign_id, filename=file.filename, stored_path=stored_path,
+                                     email_column=email_column or None, total_bytes=os.path.getsize(stored_path))
+    db.session.add(receiver_import)
+    db.session.commit()
+    return receiver_import
+
+def _iter_addresses(stream, is_csv, email_column=None):
+    if not is_csv:
+        for line in stream:
+            yield line.strip()
+        return
+
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+    names = [name.strip().lower() for name in header]
+    wanted = (email_column or 'email').strip().lower()
+    if wanted in names:
+        index = names.index(wanted)
+    elif email_column:
+        raise ValueError(f'Column "{email_column}" not found in CSV header.')
+    else:
+        # No recognizable header: the first line is data and addresses are in the first column
+        index = 0
+        yield header[0].strip() if header else ''
+    for row in reader:
+        if len(row) > index:
+            yield row[index].strip()
+
+def _write_chunk(import_id, campaign_id, chunk, bytes_read, rows_read, totals):
+    # One transaction per chunk: the receivers and the progress they represent
+    receiver_imports = ReceiverImport.__table__
+    with db.engine.begin() as conn:
+        added, duplicates, invalid = add_receivers(conn, campaign_id, chunk)
+        conn.execute(update(receiver_imports)
+                     .where(receiver_imports.c.id == import_id)
+                     .values(bytes_read=bytes_read, rows_read=rows_read,
+                             rows_imported=totals['imported'] + added,
+                             rows_duplicate=totals['duplicate'] + duplicates,
+                             rows_invalid=totals['invalid'] + invalid))
+    totals['imported'] += added
+    totals['duplicate'] += duplicates
+    totals['invalid'] += invalid
+
+def run_import(import_id):
+    receiver_import = db.session.get(ReceiverImport, import_id)
+    if not receiver_import or receiver_import.status != 'queued':
+        return
+    campaign_id = receiver_import.campaign_id
+    stored_path = receiver_import.stored_path
+    filename = receiver_import.filename.lower()
+    email_column = receiver_import.email_column
+    receiver_import.status = 'running'
+    db.session.commit() # Also ends the read transaction so the chunk writes below aren't blocked by it
+    chunk_size = current_app.config.get('IMPORT_CHUNK_SIZE', 2000)
+    rows_read = 0
+    totals = {'imported': 0, 'duplicate': 0, 'invalid': 0}
+    error = None
+    try:
+        with open(stored_path, 'rb') as raw:
+            binary = gzip.GzipFile(fileobj=raw) if filename.endswith('.gz') else raw
+            stream = io.TextIOWrapper(binary, encoding='utf-8', errors='replace', newline='')
+            chunk = []
+            for address in _iter_addresses(stream, filename.endswith(('.csv', '.csv.gz')), email_column):
+                rows_read += 1
+                if not address:
+                    continue
+                chunk.append(address)
+                if len(chunk) >= chunk_size:
+                    _write_chunk(import_id, campaign_id, chunk, raw.tell(), rows_read, totals)
+                    chunk = []
+            _write_chunk(import_id, campaign_id, chunk, raw.tell(), rows_read, totals)
+    except Exception as e:
+        current_app.logger.exception(f"Receiver import {import_id} failed")
+        error = str(e)
+    finally:
+        try:
+            os.remove(stored_path)
+        except OSError:
+            pass
+
+    receiver_import = db.session.get(ReceiverImport, import_id)
+    receiver_import.status = 'failed' if error else 'completed'
+    receiver_import.error = error
+    receiver_import.finished_at = datetime.utcnow()
+    db.session.commit()
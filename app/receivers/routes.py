@@ -1,10 +1,25 @@
-import io
-import csv
-from flask import render_template, redirect, url_for, flash, request
+import threading
+from flask import render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required
 from app import db
 from app.receivers import bp
-from app.models import ReceiverEmail, Campaign
+from app.models import ReceiverEmail, Campaign, ReceiverImport
+from app.receivers.importer import allowed_upload, save_upload, run_import, add_receivers, is_valid_email, normalize_email
+from app.tasks import import_receivers
+from app.counters import campaign_counter_update
+
+def _start_import(import_id):
+    if current_app.config.get('CAMPAIGN_RUNNER') == 'celery':
+        import_receivers.delay(import_id)
+        return
+
+    def _import_thread(import_id, app_instance):
+        with app_instance.app_context():
+            run_import(import_id)
+
+    thread = threading.Thread(target=_import_thread, args=(import_id, current_app._get_current_object()))
+    thread.daemon = True
+    thread.start()
 
 @bp.route('/')
 @login_required
@@ -21,67 +36,106 @@ def manage(campaign_id):
         if 'emails_textarea' in request.form:
             emails_raw = request.form.get('emails_textarea')
             emails = [e.strip() for e in emails_raw.split('\n') if e.strip()]
-            for email_address in emails:
-                receiver = ReceiverEmail(email=email_address, campaign=campaign)
-                db.session.add(receiver)
-            campaign.total_emails += len(emails)
+            added, duplicates, invalid = add_receivers(db.session.connection(), campaign.id, emails)
             db.session.commit()
-            flash(f'{len(emails)} receiver emails added from textarea.', 'success')
+            flash(f'{added} receiver emails added from textarea ({duplicates} duplicates skipped, {invalid} invalid rejected).', 'success')
         
         # Handle file upload
         if 'file' in request.files:
             file = request.files['file']
             if file.filename == '':
                 flash('No selected file', 'danger')
-            elif file and (file.filename.endswith('.txt') or file.filename.endswith('.csv')):
-                stream = io.TextIOWrapper(file.stream, encoding='utf-8')
-                new_emails_count = 0
-                if file.filename.endswith('.csv'):
-                    csv_reader = csv.reader(stream)
-                    for row in csv_reader:
-                        if row and row[0].strip(): # Assuming email is in the first column
-                            receiver = ReceiverEmail(email=row[0].strip(), campaign=campaign)
-                            db.session.add(receiver)
-                            new_emails_count += 1
-                else: # .txt file
-                    for line in stream:
-                        if line.strip():
-                            receiver = ReceiverEmail(email=line.strip(), campaign=campaign)
-                            db.session.add(receiver)
-                            new_emails_count += 1
-                campaign.total_emails += new_emails_count
-                db.session.commit()
-                flash(f'{new_emails_count} receiver emails added from file.', 'success')
+            elif file and allowed_upload(file.filename):
+                # Large files are parsed and inserted in chunks by a background job
+                receiver_import = save_upload(file, campaign.id, request.form.get('email_column', '').strip())
+                _start_import(receiver_import.id)
+                flash(f'Import of "{file.filename}" started. Progress is shown below.', 'info')
             else:
-                flash('Invalid file type. Please upload a .txt or .csv file.', 'danger')
+                flash('Invalid file type. Please upload a .txt or .csv file (optionally gzip-compressed).', 'danger')
         
         return redirect(url_for('receivers.manage', campaign_id=campaign.id))
 
-    total_emails = campaign.receivers.count()
-    sent_emails = campaign.receivers.filter_by(status='sent').count()
-    pending_emails = campaign.receivers.filter_by(status='pending').count()
-    failed_emails = campaign.receivers.filter_by(status='failed').count()
+    # Counters are maintained alongside status transitions, no need to count receivers
+    total_emails = campaign.total_emails
+    sent_emails = campaign.emails_sent
+    pending_emails = campaign.emails_pending
+    failed_emails = campaign.emails_failed
+
+    imports = ReceiverImport.query.filter_by(campaign_id=campaign.id).order_by(ReceiverImport.id.desc()).limit(5).all()
 
     return render_template('receivers/manage.html', 
                            title=f'Manage Receivers for {campaign.name}', 
                            campaign=campaign,
+                           imports=imports,
                            total_emails=total_emails,
                            sent_emails=sent_emails,
                            pending_emails=pending_emails,
                            failed_emails=failed_emails)
 
+@bp.route('/list_receivers/<int:campaign_id>')
+@login_required
+def list_receivers(campaign_id):
+    # Keyset pagination on ReceiverEmail.id: every page is an index range scan
+    # on (campaign_id[, status], id), so its cost doesn't grow with the campaign
+    limit = max(1, min(request.args.get('limit', 100, type=int), 500))
+    after = request.args.get('after', type=int)
+    status = request.args.get('status')
+    search = normalize_email(request.args.get('q', ''))
+
+    query = db.session.query(ReceiverEmail.id, ReceiverEmail.email, ReceiverEmail.status, ReceiverEmail.sent_at) \
+        .filter(ReceiverEmail.campaign_id == campaign_id)
+    if status:
+        query = query.filter(ReceiverEmail.status == status)
+    if search:
+        # Prefix match as a range so it can use the normalized_email index
+        query = query.filter(ReceiverEmail.normalized_email >= search,
+                             ReceiverEmail.normalized_email < search + '\uffff')
+    if after:
+        query = query.filter(ReceiverEmail.id > after)
+    rows = query.order_by(ReceiverEmail.id).limit(limit + 1).all()
+
+    return jsonify({
+        'receivers': [{
+            'id': row.id,
+            'email': row.email,
+            'status': row.status,
+            'sent_at': row.sent_at.strftime('%Y-%m-%d %H:%M:%S') if row.sent_at else None
+        } for row in rows[:limit]],
+        'next_cursor': rows[limit - 1].id if len(rows) > limit else None
+    })
+
+@bp.route('/import_status/<int:import_id>')
+@login_required
+def import_status(import_id):
+    receiver_import = ReceiverImport.query.get_or_404(import_id)
+    return jsonify({
+        'status': receiver_import.status,
+        'rows_read': receiver_import.rows_read,
+        'rows_imported': receiver_import.rows_imported,
+        'rows_duplicate': receiver_import.rows_duplicate,
+        'rows_invalid': receiver_import.rows_invalid,
+        'error': receiver_import.error,
+        'progress': (receiver_import.bytes_read / receiver_import.total_bytes * 100) if receiver_import.total_bytes else 0
+    })
+
 @bp.route('/edit_receiver/<int:receiver_id>', methods=['POST'])
 @login_required
 def edit_receiver(receiver_id):
     receiver = ReceiverEmail.query.get_or_404(receiver_id)
     campaign_id = receiver.campaign_id
-    new_email = request.form.get('email')
-    if new_email:
+    new_email = (request.form.get('email') or '').strip()
+    if not new_email:
+        flash('Email cannot be empty.', 'danger')
+    elif not is_valid_email(new_email):
+        flash('Email address is not valid.', 'danger')
+    elif ReceiverEmail.query.filter(ReceiverEmail.campaign_id == campaign_id, ReceiverEmail.id != receiver.id,
+                                    ReceiverEmail.normalized_email == normalize_email(new_email)).first():
+        flash('That email is already in this campaign.', 'danger')
+    else:
         receiver.email = new_email
+        receiver.normalized_email = normalize_email(new_email)
         db.session.commit()
         flash('Receiver email updated.', 'success')
-    else:
-        flash('Email cannot be empty.', 'danger')
     return redirect(url_for('receivers.manage', campaign_id=campaign_id))
 
 @bp.route('/delete_receiver/<int:receiver_id>', methods=['POST'])
@@ -89,10 +143,10 @@ def edit_receiver(receiver_id):
 def delete_receiver(receiver_id):
     receiver = ReceiverEmail.query.get_or_404(receiver_id)
     campaign_id = receiver.campaign_id
+    status = receiver.status if receiver.status in ('sent', 'failed') else 'pending'
     db.session.delete(receiver)
-    campaign = Campaign.query.get(campaign_id)
-    if campaign:
-        campaign.total_emails -= 1
+    if campaign_id:
+        db.session.execute(campaign_counter_update(campaign_id, **{status: -1}))
     db.session.commit()
     flash('Receiver email deleted.', 'success')
     return redirect(url_for('receivers.manage', campaign_id=campaign_id))
@@ -101,8 +155,9 @@ def delete_receiver(receiver_id):
 @login_required
 def create_campaign():
     campaign_name = request.form.get('campaign_name')
+    send_concurrency = request.form.get('send_concurrency', type=int)
     if campaign_name:
-        campaign = Campaign(name=campaign_name)
+        campaign = Campaign(name=campaign_name, send_concurrency=send_concurrency)
         db.session.add(campaign)
         db.session.commit()
         flash(f'Campaign "{campaign_name}" created successfully!', 'success')
@@ -0,0 +1,100 @@
+import re
+import threading
+from collections import OrderedDict
+from app import db
+from app.models import MessageTemplate
+from app.mime import MessageSkeleton
+
+# Templates are compiled once into render plans: the text split around its
+# placeholders into static segments and slots, so personalizing a message is a
+# single join instead of a str.replace pass over the whole body per field.
+# Plans are cached per (template id, MessageTemplate.version); editing a
+# template bumps its version, so every process picks up the new content.
+
+PLACEHOLDER_PATTERN = re.compile(r'\{(name|email|domain|campaign)\}')
+
+class RenderPlan:
+    __slots__ = ('segments', 'slots')
+
+    def __init__(self, text):
+        # segments holds the static text with a None gap for each placeholder;
+        # slots pairs those gaps with the field that fills them
+        self.segments = []
+        self.slots = []
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            self.segments.append(text[position:match.start()])
+            self.slots.append((len(self.segments), match.group(1)))
+            self.segments.append(None)
+            position = match.end()
+        self.segments.append(text[position:])
+
+    def render(self, fields):
+        if not self.slots:
+            return self.segments[0]
+        parts = self.segments[:]
+        for index, field in self.slots:
+            parts[index] = fields[field]
+        return ''.join(parts)
+
+class MessagePlan:
+    # Render plans for one version of a MessageTemplate, plus its pre-encoded MIME skeleton
+    __slots__ = ('template_id', 'version', 'subject', 'html', 'plain', 'skeleton')
+
+    def __init__(self, template):
+        self.template_id = template.id
+        self.version = template.version
+        self.subject = RenderPlan(template.subject)
+        self.html = RenderPlan(template.body_html)
+        self.plain = RenderPlan(template.body_plain) if template.body_plain else None
+        self.skeleton = MessageSkeleton(self)
+
+def personalization_fields(receiver_email, campaign_name=''):
+    local_part, _, domain = receiver_email.partition('@')
+    return {'name': local_part, 'email': receiver_email, 'domain': domain, 'campaign': campaign_name or ''}
+
+class RenderPlanCache:
+    # LRU of MessagePlans keyed by (template id, version)
+
+    def __init__(self, app=None):
+        self.max_size = 64
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_size = app.config.get('TEMPLATE_CACHE_SIZE', self.max_size)
+        app.extensions['render_plans'] = self
+
+    def get(self, template_id):
+        # Only the version column is read per call; the bodies are loaded and
+        # compiled on a miss. Returns None if the template doesn't exist.
+        version = db.session.query(MessageTemplate.version).filter_by(id=template_id).scalar()
+        if version is None:
+            return None
+        key = (template_id, version)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                return plan
+        template = db.session.get(MessageTemplate, template_id)
+        if template is None:
+            return None
+        return self.put(MessagePlan(template))
+
+    def put(self, plan):
+        with self._lock:
+            self._plans[(plan.template_id, plan.version)] = plan
+            self._plans.move_to_end((plan.template_id, plan.version))
+            while len(self._plans) > self.max_size:
+                self._plans.popitem(last=False)
+        return plan
+
+    def invalidate(self, template_id):
+        with self._lock:
+            for key in [key for key in self._plans if key[0] == template_id]:
+                del self._plans[key]
+
+render_plans = RenderPlanCache()
@@ -0,0 +1,177 @@
+import glob
+import gzip
+import json
+import os
+from datetime import date, datetime, timedelta
+import click
+from flask import current_app
+from sqlalchemy import delete, insert, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db, celery
+from app.models import LogEntry
+
+# Keeps log_entry bounded. Entries older than LOG_RETENTION_DAYS are deleted in
+# chunks of LOG_PURGE_CHUNK_SIZE, oldest first along ix_log_entry_timestamp,
+# one short transaction per chunk. With LOG_ARCHIVE on, each chunk is first
+# appended to a gzipped JSON-lines file per day under LOG_ARCHIVE_PATH
+# (<year>/<month>/log-<date>.jsonl.gz), which can be searched or restored.
+# Rollups are left alone, so dashboard history survives the purge.
+
+_COLUMNS = ('id', 'timestamp', 'level', 'message', 'sender_email', 'receiver_email', 'status', 'error_reason', 'campaign_id')
+
+def archive_root():
+    return current_app.config.get('LOG_ARCHIVE_PATH') or os.path.join(current_app.instance_path, 'log_archive')
+
+def _archive_file(day):
+    if day is None:
+        return os.path.join(archive_root(), 'undated', 'log-undated.jsonl.gz')
+    return os.path.join(archive_root(), f'{day:%Y}', f'{day:%m}', f'log-{day.isoformat()}.jsonl.gz')
+
+def _archive(rows):
+    # Appends rows to their day's file; every append is a new gzip member,
+    # which gzip readers concatenate transparently
+    by_day = {}
+    for row in rows:
+        record = {column: row[column] for column in _COLUMNS}
+        record['timestamp'] = record['timestamp'].isoformat() if record['timestamp'] else None
+        by_day.setdefault(row['timestamp'].date() if row['timestamp'] else None, []).append(record)
+    for day, records in by_day.items():
+        path = _archive_file(day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with gzip.open(path, 'at', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+
+def purge_logs(before=None, archive=None, chunk_size=None):
+    # Deletes log entries older than `before` (every entry when None), oldest
+    # first. Rows are archived before their chunk is deleted, so a crash can at
+    # worst archive a chunk twice, never lose it. Returns the number deleted.
+    archive = current_app.config.get('LOG_ARCHIVE', True) if archive is None else archive
+    chunk_size = chunk_size or current_app.config.get('LOG_PURGE_CHUNK_SIZE', 1000)
+    logs = LogEntry.__table__
+    query = select(*[logs.c[column] for column in _COLUMNS] if archive else [logs.c.id])
+    if before is not None:
+        query = query.where(logs.c.timestamp < before).order_by(logs.c.timestamp, logs.c.id)
+    else:
+        query = query.order_by(logs.c.id)
+    deleted = 0
+    while True:
+        with db.engine.begin() as conn:
+            rows = conn.execute(query.limit(chunk_size)).mappings().all()
+            if not rows:
+                break
+            if archive:
+                _archive(rows)
+            conn.execute(delete(logs).where(logs.c.id.in_([row['id'] for row in rows])))
+        deleted += len(rows)
+    return deleted
+
+def purge_expired_logs_now():
+    days = current_app.config.get('LOG_RETENTION_DAYS', 0)
+    if not days:
+        return 0
+    return purge_logs(datetime.utcnow() - timedelta(days=days))
+
+def _archive_days(since=None, until=None):
+    # Archive files in date order, limited to the days [since, until] touch
+    paths = sorted(glob.glob(os.path.join(archive_root(), '[0-9]' * 4, '[0-9]' * 2, 'log-*.jsonl.gz')))
+    for path in paths:
+        day = date.fromisoformat(os.path.basename(path)[len('log-'):-len('.jsonl.gz')])
+        if (since is None or day >= since.date()) and (until is None or day <= until.date()):
+            yield path
+    # Entries without a timestamp can't match a date range
+    undated = _archive_file(None)
+    if since is None and until is None and os.path.exists(undated):
+        yield undated
+
+def iter_archived_logs(since=None, until=None, campaign_id=None, status=None, search=None):
+    # Streams archived entries (timestamps as datetimes) matching the filters.
+    # Entries restored and purged again appear once per archival.
+    search = search.lower() if search else None
+    for path in _archive_days(since, until):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                record['timestamp'] = datetime.fromisoformat(record['timestamp']) if record['timestamp'] else None
+                if since is not None and (record['timestamp'] is None or record['timestamp'] < since):
+                    continue
+                if until is not None and (record['timestamp'] is None or record['timestamp'] >= until):
+                    continue
+                if campaign_id is not None and record.get('campaign_id') != campaign_id:
+                    continue
+                if status is not None and record['status'] != status:
+                    continue
+                if search is not None and not any(search in (record.get(column) or '').lower()
+                                                  for column in ('message', 'sender_email', 'receiver_email', 'error_reason')):
+                    continue
+                yield record
+
+def _insert_ignoring_existing(conn):
+    # Entries still in (or already restored to) log_entry keep their ids
+    table = LogEntry.__table__
+    if conn.dialect.name == 'postgresql':
+        return postgresql_insert(table).on_conflict_do_nothing(index_elements=['id'])
+    if conn.dialect.name == 'sqlite':
+        return sqlite_insert(table).on_conflict_do_nothing(index_elements=['id'])
+    return insert(table)
+
+def restore_archived_logs(since=None, until=None, campaign_id=None, status=None, search=None, batch_size=1000):
+    # Re-imports matching archived entries into log_entry, with their original
+    # ids, without touching the rollups that already count them. Restored
+    # entries older than the retention window go again on the next purge.
+    restored = 0
+    batch = []
+    for record in iter_archived_logs(since, until, campaign_id, status, search):
+        batch.append({column: record.get(column) for column in _COLUMNS})
+        if len(batch) >= batch_size:
+            with db.engine.begin() as conn:
+                restored += conn.execute(_insert_ignoring_existing(conn), batch).rowcount
+            batch = []
+    if batch:
+        with db.engine.begin() as conn:
+            restored += conn.execute(_insert_ignoring_existing(conn), batch).rowcount
+    return restored
+
+@celery.task(name='app.retention.purge_expired_logs')
+def purge_expired_logs():
+    return purge_expired_logs_now()
+
+@click.group('logs')
+def logs_command():
+    """Log retention: purge, search and restore archived log entries."""
+
+@logs_command.command('purge')
+@click.option('--days', type=int, default=None, help='Purge entries older than this many days (default LOG_RETENTION_DAYS).')
+@click.option('--archive/--no-archive', default=None, help='Archive purged entries (default LOG_ARCHIVE).')
+def purge_command(days, archive):
+    """Delete expired log entries in chunks, archiving them first."""
+    days = current_app.config.get('LOG_RETENTION_DAYS', 0) if days is None else days
+    if not days:
+        click.echo('Log retention is disabled (LOG_RETENTION_DAYS=0); pass --days to purge anyway.')
+        return
+    deleted = purge_logs(datetime.utcnow() - timedelta(days=days), archive=archive)
+    click.echo(f'Purged {deleted} log entries older than {days} day(s).')
+
+def _archive_filters(function):
+    function = click.option('--since', type=click.DateTime(), default=None, help='From this time (UTC).')(function)
+    function = click.option('--until', type=click.DateTime(), default=None, help='Before this time (UTC).')(function)
+    function = click.option('--campaign-id', type=int, default=None)(function)
+    function = click.option('--status', default=None)(function)
+    function = click.option('--search', default=None, help='Text in the message, sender, receiver or error reason.')(function)
+    return function
+
+@logs_command.command('search-archive')
+@_archive_filters
+def search_archive_command(since, until, campaign_id, status, search):
+    """Print matching archived log entries as JSON lines."""
+    for record in iter_archived_logs(since, until, campaign_id, status, search):
+        record['timestamp'] = record['timestamp'].isoformat() if record['timestamp'] else None
+        click.echo(json.dumps(record))
+
+@logs_command.command('restore-archive')
+@_archive_filters
+def restore_archive_command(since, until, campaign_id, status, search):
+    """Re-import matching archived log entries into the log table."""
+    restored = restore_archived_logs(since, until, campaign_id, status, search)
+    click.echo(f'Restored {restored} log entries.')
@@ -0,0 +1,41 @@
+import heapq
+import itertools
+import random
+import time
+
+def backoff_delay(attempt, base_delay=5.0, max_delay=300.0):
+    # Exponential backoff with jitter: attempt 1 waits 2.5-5s, attempt 2 5-10s, ...
+    # The jitter keeps receivers that failed together from retrying together.
+    ceiling = min(max_delay, base_delay * (2 ** (attempt - 1)))
+    return random.uniform(ceiling / 2, ceiling)
+
+class RetryScheduler:
+    # Time-ordered heap of receivers parked for another attempt. The send loop
+    # keeps sending fresh receivers and picks these up once they are due.
+    # A receiver is whatever the loop passes in, e.g. an (id, email) tuple.
+
+    def __init__(self, base_delay=5.0, max_delay=300.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._heap = []
+        self._order = itertools.count() # Tie-breaker so equal due times never compare receivers
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, receiver, attempt):
+        due_at = time.monotonic() + backoff_delay(attempt, self.base_delay, self.max_delay)
+        heapq.heappush(self._heap, (due_at, next(self._order), receiver, attempt))
+
+    def pop_due(self):
+        now = time.monotonic()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, receiver, attempt = heapq.heappop(self._heap)
+            due.append((receiver, attempt))
+        return due
+
+    def next_due_in(self):
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - time.monotonic())
@@ -0,0 +1,130 @@
+from collections import Counter
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from app.models import LogEntry, LogRollup
+
+# LogRollup holds event counts per (granularity, bucket, sender, campaign,
+# status). The log sink adds every batch it writes to them in the same
+# transaction as the log rows, so the dashboard reads a handful of rollup rows
+# instead of counting log_entry. rebuild_rollups recomputes them from raw logs.
+
+GRANULARITIES = ('minute', 'hour', 'day')
+_KEY = ('granularity', 'bucket_start', 'sender_email', 'campaign_id', 'status')
+_STEPS = {'minute': timedelta(minutes=1), 'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+
+def bucket_start(timestamp, granularity):
+    if granularity == 'minute':
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def count_records(records, counts=None):
+    # Adds log records (dicts or row mappings) to a Counter keyed like the rollup index
+    counts = Counter() if counts is None else counts
+    for record in records:
+        for granularity in GRANULARITIES:
+            counts[(granularity, bucket_start(record['timestamp'], granularity), record.get('sender_email') or '',
+                    record.get('campaign_id') or 0, record.get('status') or '')] += 1
+    return counts
+
+def apply_rollup_counts(conn, counts):
+    # Adds `counts` to the rollup rows with one upsert. Rows are sorted so
+    # concurrent writers lock them in the same order.
+    if not counts:
+        return
+    table = LogRollup.__table__
+    rows = [dict(zip(_KEY, key), count=count) for key, count in sorted(counts.items())]
+    if conn.dialect.name in ('postgresql', 'sqlite'):
+        stmt = (postgresql_insert if conn.dialect.name == 'postgresql' else sqlite_insert)(table)
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c[name] for name in _KEY],
+                                          set_={'count': table.c.count + stmt.excluded['count']})
+        conn.execute(stmt, rows)
+        return
+    for row in rows:
+        matched = conn.execute(update(table)
+                               .where(*[table.c[name] == row[name] for name in _KEY])
+                               .values(count=table.c.count + row['count'])).rowcount
+        if not matched:
+            conn.execute(insert(table), row)
+
+def rebuild_rollups(since=None, chunk_size=10000):
+    # Recomputes the rollups from log_entry in id-ordered chunks, inside one
+    # transaction so readers never see them half built. With `since`, only
+    # buckets from that day on are replaced, which keeps the history of logs
+    # that have already been purged. Returns the number of log entries read.
+    rollups = LogRollup.__table__
+    logs = LogEntry.__table__
+    if since is not None:
+        since = bucket_start(since, 'day')
+    with db.engine.begin() as conn:
+        clear = delete(rollups)
+        query = select(logs.c.id, logs.c.timestamp, logs.c.sender_email, logs.c.campaign_id, logs.c.status) \
+            .where(logs.c.timestamp.isnot(None))
+        if since is not None:
+            clear = clear.where(rollups.c.bucket_start >= since)
+            query = query.where(logs.c.timestamp >= since)
+        conn.execute(clear)
+        # Entries written after this point are added to the rollups by the log sink itself
+        max_id = conn.execute(select(func.max(logs.c.id))).scalar() or 0
+        last_id = read = 0
+        while last_id < max_id:
+            rows = conn.execute(query.where(logs.c.id > last_id, logs.c.id <= max_id)
+                                .order_by(logs.c.id).limit(chunk_size)).mappings().all()
+            if not rows:
+                break
+            apply_rollup_counts(conn, count_records(rows))
+            last_id = rows[-1]['id']
+            read += len(rows)
+    return read
+
+def rollup_totals(granularity='day', since=None, campaign_id=None, sender_email=None):
+    # {status: count} summed over the matching buckets
+    query = db.session.query(LogRollup.status, func.sum(LogRollup.count)) \
+        .filter(LogRollup.granularity == granularity) \
+        .group_by(LogRollup.status)
+    if since is not None:
+        query = query.filter(LogRollup.bucket_start >= bucket_start(since, granularity))
+    if campaign_id is not None:
+        query = query.filter(LogRollup.campaign_id == campaign_id)
+    if sender_email is not None:
+        query = query.filter(LogRollup.sender_email == sender_email)
+    return {status: int(count) for status, count in query}
+
+def throughput(granularity, since, until=None, statuses=('success', 'failure'), campaign_id=None, sender_email=None):
+    # One point per bucket from `since` to `until`, including empty buckets:
+    # [(bucket_start, {status: count})]
+    since = bucket_start(since, granularity)
+    until = bucket_start(until or datetime.utcnow(), granularity)
+    query = db.session.query(LogRollup.bucket_start, LogRollup.status, func.sum(LogRollup.count)) \
+        .filter(LogRollup.granularity == granularity,
+                LogRollup.bucket_start >= since, LogRollup.bucket_start <= until,
+                LogRollup.status.in_(statuses)) \
+        .group_by(LogRollup.bucket_start, LogRollup.status)
+    if campaign_id is not None:
+        query = query.filter(LogRollup.campaign_id == campaign_id)
+    if sender_email is not None:
+        query = query.filter(LogRollup.sender_email == sender_email)
+    counts = {}
+    for start, status, count in query:
+        counts.setdefault(start, Counter())[status] += int(count)
+
+    points = []
+    start = since
+    while start <= until:
+        points.append((start, counts.get(start, Counter())))
+        start += _STEPS[granularity]
+    return points
+
+@click.command('rebuild-rollups')
+@click.option('--since', type=click.DateTime(), default=None, help='Only rebuild buckets from this day on (UTC).')
+def rebuild_rollups_command(since):
+    """Rebuild the dashboard rollup tables from the raw log entries."""
+    from app.log_sink import log_sink
+    log_sink.flush() # Make sure queued entries are in log_entry first
+    read = rebuild_rollups(since)
+    click.echo(f'Rebuilt rollups from {read} log entries.')
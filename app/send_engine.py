@@ -0,0 +1,156 @@
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from app.email_utils import send_batch, CampaignSendContext
+from app.retry import RetryScheduler
+from app.write_behind import status_buffer
+from app.rate_limit import rate_limiter
+from app.sender_pool import SenderPool
+from app.claims import new_owner, claim_receivers, extend_leases, release_claims, count_live_claims
+from app.control import campaign_control
+from app.log_sink import log_sink
+
+async def send_batch_async(context, receivers, app_instance, retry_count=0, executor=None, signal=None):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, send_batch, context, receivers, app_instance, retry_count, signal)
+
+async def send_campaign_async(campaign_id, app_instance, concurrency=None):
+    # Sends the campaign's pending receivers with up to `concurrency` SMTP
+    # transactions in flight. Receivers are claimed in leased keyset pages of
+    # (id, email) tuples (app.claims), so memory stays flat however large the
+    # campaign is, receivers added mid-run are picked up, and any number of
+    # workers can run this for the same campaign; it returns once nothing is
+    # left to claim and no other worker holds a live lease. Per-sender
+    # concurrency is enforced by the SMTP pool, which caps the sessions each
+    # sender may hold open (SenderEmail.max_concurrency); pacing comes from the
+    # token-bucket rate limiter. Transient failures are parked in a retry
+    # scheduler and sent again once their backoff expires, without holding a
+    # slot. Campaign, template plan and senders are read once into a
+    # CampaignSendContext shared by every send of the run; each slot sends a
+    # chunk of up to SEND_CHUNK_SIZE receivers per executor hop.
+    # Pause and stop come from app.control: chunks halt before their next
+    # message (also one still waiting for a sender's cooldown or rate budget),
+    # a pause waits on the run's signal, and a stop lets the in-flight messages
+    # finish, flushes buffered writes and returns.
+    concurrency = concurrency or app_instance.config.get('SEND_CONCURRENCY', 4)
+    batch_size = app_instance.config.get('CAMPAIGN_BATCH_SIZE', 500)
+    chunk_size = max(1, app_instance.config.get('SEND_CHUNK_SIZE', 10))
+    lease_seconds = app_instance.config.get('RECEIVER_LEASE_SECONDS', 300)
+    renew_interval = lease_seconds / 3.0
+    retries = RetryScheduler(app_instance.config.get('RETRY_BASE_DELAY', 5.0),
+                             app_instance.config.get('RETRY_MAX_DELAY', 300.0))
+    slots = asyncio.Semaphore(concurrency)
+    with app_instance.app_context():
+        context = CampaignSendContext.load(campaign_id, app_instance, SenderPool.load(rate_limiter))
+    if context is None:
+        app_instance.logger.error(f"Campaign {campaign_id} or its template no longer exists; nothing sent")
+        return
+    signal = campaign_control.watch(campaign_id)
+    in_flight = set()
+    owner = new_owner()
+    claimed = deque()
+    state = {'renew_at': time.monotonic() + renew_interval, 'claim_at': 0.0, 'after_id': 0}
+
+    async def _db(function, *args):
+        # Claim bookkeeping runs off the event loop, in its own app context
+        def call():
+            with app_instance.app_context():
+                return function(*args)
+        return await asyncio.to_thread(call)
+
+    async def _renew():
+        # Keeps this worker's leases alive, also while the campaign is paused
+        if time.monotonic() >= state['renew_at']:
+            await _db(extend_leases, campaign_id, owner, lease_seconds)
+            state['renew_at'] = time.monotonic() + renew_interval
+
+    async def _idle(seconds):
+        # Sleeps, but wakes up as soon as the campaign is stopped
+        await asyncio.to_thread(signal.stopped.wait, seconds)
+
+    async def _claim():
+        # Next keyset page after the last claimed id. At the end of the id range
+        # it wraps around once, for receivers that came back to pending below
+        # the cursor (expired or released leases).
+        page = await _db(claim_receivers, campaign_id, owner, batch_size, lease_seconds, state['after_id'])
+        if not page and state['after_id']:
+            state['after_id'] = 0
+            page = await _db(claim_receivers, campaign_id, owner, batch_size, lease_seconds, 0)
+        if page:
+            state['after_id'] = page[-1][0]
+        return page
+
+    async def _send(executor, receivers, attempt):
+        try:
+            unsent = []
+            for receiver, outcome in await send_batch_async(context, receivers, app_instance, attempt, executor, signal):
+                if outcome == 'retry':
+                    retries.schedule(receiver, attempt + 1)
+                elif outcome is None and attempt:
+                    retries.schedule(receiver, attempt)
+                elif outcome is None:
+                    unsent.append(receiver)
+            claimed.extendleft(reversed(unsent)) # Halted mid-chunk; send them first once resumed
+        except Exception:
+            app_instance.logger.exception(f"Unexpected error sending to receivers {[receiver[0] for receiver in receivers]} in campaign {campaign_id}")
+        finally:
+            slots.release()
+
+    async def _dispatch(executor, receivers, attempt):
+        await slots.acquire()
+        task = asyncio.ensure_future(_send(executor, receivers, attempt))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f'campaign-{campaign_id}') as executor:
+            while True:
+                await _renew()
+                if signal.is_paused():
+                    status_buffer.flush() # Make progress visible while the campaign sits paused
+                    while signal.is_paused():
+                        await _renew()
+                        await asyncio.to_thread(signal.wait_until_running, max(0.0, state['renew_at'] - time.monotonic()))
+                if signal.is_stopped():
+                    break
+
+                for receiver, attempt in retries.pop_due():
+                    await _dispatch(executor, [receiver], attempt)
+
+                if not claimed and time.monotonic() >= state['claim_at']:
+                    claimed.extend(await _claim())
+                    if not claimed:
+                        state['claim_at'] = time.monotonic() + 1.0 # Nothing pending right now
+                if claimed:
+                    await _dispatch(executor, [claimed.popleft() for _ in range(min(chunk_size, len(claimed)))], 0)
+                    continue
+
+                if not retries and not in_flight:
+                    # Another worker's receivers come back to pending if its lease
+                    # runs out, so only finish once no live lease is left. Claims
+                    # released since the last claim attempt are pending again,
+                    # so claim once more before finishing.
+                    if not await _db(count_live_claims, campaign_id, owner):
+                        claimed.extend(await _claim())
+                        if not claimed:
+                            break
+                        continue
+                    await _idle(1.0)
+                    continue
+                # Only parked retries (or in-flight sends that may park one) are left
+                next_due = retries.next_due_in()
+                await _idle(min(next_due, 0.5) if next_due is not None else 0.1)
+
+            if in_flight:
+                await asyncio.gather(*in_flight) # Drain: chunks halt before their next message
+    finally:
+        campaign_control.unwatch(signal)
+        status_buffer.flush()
+        log_sink.flush()
+        with app_instance.app_context():
+            release_claims(campaign_id, owner) # Unsent receivers go back to pending for the next run
+
+def send_campaign(campaign_id, app_instance, concurrency=None):
+    # Blocking entry point for callers that are not already inside an event loop
+    asyncio.run(send_campaign_async(campaign_id, app_instance, concurrency))
@@ -0,0 +1,128 @@
+import heapq
+import itertools
+import threading
+import time
+from app.models import SenderEmail, decrypt_password
+from app.credentials import credential_cache
+
+class PooledSender:
+    # Detached snapshot of a SenderEmail row, safe to share between send threads.
+    # Carries what the SMTP pool and rate limiter read, plus the pool's state.
+    __slots__ = ('id', 'email', '_password_encrypted', 'max_concurrency', 'rate_per_minute', 'rate_burst',
+                 'remaining', 'in_flight', 'cooldown_until', 'disabled', 'version')
+
+    def __init__(self, sender):
+        self.id = sender.id
+        self.email = sender.email
+        self._password_encrypted = sender._password_encrypted
+        self.max_concurrency = sender.max_concurrency
+        self.rate_per_minute = sender.rate_per_minute
+        self.rate_burst = sender.rate_burst
+        self.remaining = max(0, (sender.sending_limit or 0) - (sender.sent_count or 0))
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.disabled = False
+        self.version = 0
+
+    @property
+    def password(self):
+        return credential_cache.get(self.id, self._password_encrypted, decrypt_password)
+
+class SenderPool:
+    # The senders of one campaign run, loaded with a single query and then kept
+    # in memory. Selection is least-loaded: fewest sends in flight, then most
+    # quota left, from a heap (O(log n) per pick, stale entries skipped lazily).
+    # Quota is taken when a sender is picked and handed back if the send fails;
+    # sent_count itself reaches the DB through the write-behind buffer. Senders
+    # that fail to log in leave the rotation for the rest of the run, and ones
+    # whose server or rate budget pushes back sit out a cooldown.
+
+    def __init__(self, senders, rate_limiter=None):
+        self.rate_limiter = rate_limiter
+        self._senders = {sender.id: PooledSender(sender) for sender in senders}
+        self._ready = [] # (in_flight, -remaining, seq, sender_id, version)
+        self._cooling = [] # (cooldown_until, seq, sender_id, version)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        for sender in self._senders.values():
+            self._push(sender)
+
+    @classmethod
+    def load(cls, rate_limiter=None):
+        return cls(SenderEmail.query.filter(SenderEmail.sent_count < SenderEmail.sending_limit).all(), rate_limiter)
+
+    def _push(self, sender):
+        # Must be called with self._lock held. Re-keys `sender`; its older heap entries go stale.
+        sender.version += 1
+        if sender.disabled or sender.remaining <= 0:
+            return
+        if sender.cooldown_until > time.monotonic():
+            heapq.heappush(self._cooling, (sender.cooldown_until, next(self._seq), sender.id, sender.version))
+        else:
+            heapq.heappush(self._ready, (sender.in_flight, -sender.remaining, next(self._seq), sender.id, sender.version))
+
+    def _pop(self):
+        # Must be called with self._lock held
+        now = time.monotonic()
+        while self._cooling and self._cooling[0][0] <= now:
+            _, _, sender_id, version = heapq.heappop(self._cooling)
+            sender = self._senders[sender_id]
+            if sender.version == version:
+                self._push(sender)
+        while self._ready:
+            _, _, _, sender_id, version = heapq.heappop(self._ready)
+            sender = self._senders[sender_id]
+            if sender.version == version:
+                return sender
+        return None
+
+    def acquire(self, signal=None):
+        # Returns a sender with quota and rate budget left, waiting while the
+        # only candidates are cooling down. Returns None once no sender is left,
+        # or as soon as the run's `signal` (app.control) is paused or stopped.
+        while True:
+            if signal is not None and signal.is_halted():
+                return None
+            with self._lock:
+                sender = self._pop()
+                if sender is not None:
+                    sender.in_flight += 1
+                    sender.remaining -= 1
+                    self._push(sender)
+                elif not self._cooling:
+                    return None
+                else:
+                    wait = self._cooling[0][0] - time.monotonic()
+            if sender is None:
+                wait = min(max(wait, 0.01), 1.0)
+                if signal is not None:
+                    signal.wait_until_halted(wait)
+                else:
+                    time.sleep(wait)
+                continue
+
+            wait = self.rate_limiter.try_acquire(sender) if self.rate_limiter else 0
+            if wait <= 0:
+                return sender
+            with self._lock:
+                sender.in_flight -= 1
+                sender.remaining += 1
+                sender.cooldown_until = time.monotonic() + wait
+                self._push(sender)
+
+    def release(self, sender, sent):
+        with self._lock:
+            sender.in_flight -= 1
+            if not sent:
+                sender.remaining += 1
+            self._push(sender)
+
+    def cool_down(self, sender, seconds):
+        with self._lock:
+            sender.cooldown_until = time.monotonic() + seconds
+            self._push(sender)
+
+    def disable(self, sender):
+        with self._lock:
+            sender.disabled = True
+            self._push(sender)
@@ -3,6 +3,8 @@ from flask_login import login_required
 from app import db
 from app.senders import bp
 from app.models import SenderEmail
+from app.email_utils import smtp_pool
+from app.credentials import credential_cache
 
 @bp.route('/')
 @login_required
@@ -17,12 +19,16 @@ def add():
         email = request.form.get('email')
         password = request.form.get('password')
         sending_limit = request.form.get('sending_limit', type=int)
+        max_concurrency = request.form.get('max_concurrency', type=int)
+        rate_per_minute = request.form.get('rate_per_minute', type=int)
+        rate_burst = request.form.get('rate_burst', type=int)
 
         if not email or not password:
             flash('Email and password are required.', 'danger')
             return redirect(url_for('senders.add'))
 
-        sender = SenderEmail(email=email, password=password, sending_limit=sending_limit)
+        sender = SenderEmail(email=email, password=password, sending_limit=sending_limit, max_concurrency=max_concurrency,
+                             rate_per_minute=rate_per_minute, rate_burst=rate_burst)
         db.session.add(sender)
         db.session.commit()
         flash('Sender email added successfully!', 'success')
@@ -37,11 +43,16 @@ def edit(sender_id):
         sender.email = request.form.get('email')
         new_password = request.form.get('password')
         sender.sending_limit = request.form.get('sending_limit', type=int)
+        sender.max_concurrency = request.form.get('max_concurrency', type=int)
+        sender.rate_per_minute = request.form.get('rate_per_minute', type=int)
+        sender.rate_burst = request.form.get('rate_burst', type=int)
 
         if new_password:
             sender.password = new_password # Setter will encrypt
 
         db.session.commit()
+        smtp_pool.close_idle(sender.id) # Drop sessions logged in with the old credentials
+        credential_cache.invalidate(sender.id)
         flash('Sender email updated successfully!', 'success')
         return redirect(url_for('senders.index'))
     return render_template('senders/add_edit.html', title='Edit Sender Email', sender=sender)
@@ -50,7 +61,10 @@ def edit(sender_id):
 @login_required
 def delete(sender_id):
     sender = SenderEmail.query.get_or_404(sender_id)
+    sender_id = sender.id
     db.session.delete(sender)
     db.session.commit()
+    smtp_pool.close_idle(sender_id)
+    credential_cache.invalidate(sender_id)
     flash('Sender email deleted successfully!', 'success')
     return redirect(url_for('senders.index'))
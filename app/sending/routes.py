@@ -1,19 +1,23 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify, current_app
+from flask import render_template, redirect, url_for, flash, request, jsonify, current_app, Response
 from flask_login import login_required
 from app import db
 from app.sending import bp
 from app.models import Campaign, ReceiverEmail, MessageTemplate, SenderEmail, LogEntry, TelegramSettings
-from app.email_utils import send_email_task_sync, log_event
+from app.email_utils import log_event, smtp_pool
+from app.send_engine import send_campaign
+from app.tasks import complete_campaign, run_campaign
+from app.write_behind import status_buffer
+from app.control import campaign_control
+from app.progress import progress_hub
+from app.status_cache import status_cache
 from app.telegram.routes import send_telegram_message
 from datetime import datetime
+import queue
 import threading
-import time
 
 # Dictionary to hold thread objects for campaigns (for potential pause/resume/stop logic)
 campaign_threads = {}
-# A simple flag to control sending state
-sending_paused = {}
-sending_stopped = {}
+PROGRESS_KEEPALIVE_SECONDS = 15 # Comment line sent on idle streams so proxies keep them open
 
 @bp.route('/')
 @login_required
@@ -39,51 +43,52 @@ def start_campaign(campaign_id):
         flash('No sender emails configured. Please add at least one.', 'danger')
         return redirect(url_for('sending.index'))
 
+    previous_status, previous_started_at = campaign.status, campaign.started_at
+    started_at = datetime.utcnow() # Identifies this run when it completes
     campaign.template_id = active_template.id
     campaign.status = 'running'
-    campaign.started_at = datetime.utcnow()
+    campaign.started_at = started_at
     db.session.commit()
 
-    log_event('INFO', f'Campaign "{campaign.name}" started.', status='started')
-    telegram_settings = TelegramSettings.query.first()
-    if telegram_settings and telegram_settings.alerts_enabled and telegram_settings.alert_sending_started:
-        send_telegram_message(telegram_settings.bot_token, telegram_settings.chat_id, f'Campaign <b>"{campaign.name}"</b> started!')
-
     # Start sending in a new thread
-    def _send_campaign_thread(campaign_id, app_instance):
+    def _send_campaign_thread(campaign_id, started_at, app_instance):
         with app_instance.app_context():
             campaign = Campaign.query.get(campaign_id)
             if not campaign:
                 return
 
-            sending_paused[campaign_id] = False
-            sending_stopped[campaign_id] = False
-
-            pending_receivers = campaign.receivers.filter_by(status='pending').all()
-            for receiver in pending_receivers:
-                if sending_stopped.get(campaign_id):
-                    break
-                while sending_paused.get(campaign_id):
-                    time.sleep(1) # Wait if paused
-                
-                send_email_task_sync(receiver.id, campaign.id, app_instance)
-                # Small delay to prevent overwhelming SMTP server and allow UI updates
-                time.sleep(1) 
+            concurrency = campaign.send_concurrency
+            db.session.commit()
+            send_campaign(campaign_id, app_instance, concurrency=concurrency)
+
+            smtp_pool.close_idle() # Don't hold provider sessions open once the campaign is done
             
-            # After loop, if not stopped, set to completed
-            if not sending_stopped.get(campaign_id):
-                campaign.status = 'completed'
-                campaign.completed_at = datetime.utcnow()
-                db.session.commit()
-                log_event('INFO', f'Campaign "{campaign.name}" completed.', status='completed')
-                telegram_settings = TelegramSettings.query.first()
-                if telegram_settings and telegram_settings.alerts_enabled and telegram_settings.alert_sending_paused_resumed_stopped:
-                    send_telegram_message(telegram_settings.bot_token, telegram_settings.chat_id, f'Campaign <b>"{campaign.name}"</b> completed!')
-
-    thread = threading.Thread(target=_send_campaign_thread, args=(campaign.id, current_app._get_current_object()))
-    thread.daemon = True # Allow main program to exit even if thread is running
-    thread.start()
-    campaign_threads[campaign.id] = thread # Store thread object if needed
+            # After loop, set to completed unless it was stopped
+            db.session.commit() # End the loop's transaction so the status check sees the stop
+            complete_campaign(campaign_id, started_at)
+
+    if current_app.config.get('CAMPAIGN_RUNNER') == 'celery':
+        # Hand the campaign to the Celery workers; it survives web process restarts
+        try:
+            run_campaign.delay(campaign.id, started_at.isoformat())
+        except Exception as e:
+            # Nothing will send it, so don't leave the campaign 'running'
+            current_app.logger.exception(f"Failed to dispatch campaign {campaign.id} to Celery")
+            campaign.status, campaign.started_at = previous_status, previous_started_at
+            db.session.commit()
+            log_event('ERROR', f'Campaign "{campaign.name}" could not be started: {e}', status='failure', campaign_id=campaign.id)
+            flash(f'Campaign "{campaign.name}" could not be handed to the workers: {e}', 'danger')
+            return redirect(url_for('sending.index'))
+    else:
+        thread = threading.Thread(target=_send_campaign_thread, args=(campaign.id, started_at, current_app._get_current_object()))
+        thread.daemon = True # Allow main program to exit even if thread is running
+        thread.start()
+        campaign_threads[campaign.id] = thread # Store thread object if needed
+
+    log_event('INFO', f'Campaign "{campaign.name}" started.', status='started', campaign_id=campaign.id)
+    telegram_settings = TelegramSettings.query.first()
+    if telegram_settings and telegram_settings.alerts_enabled and telegram_settings.alert_sending_started:
+        send_telegram_message(telegram_settings.bot_token, telegram_settings.chat_id, f'Campaign <b>"{campaign.name}"</b> started!')
 
     flash(f'Campaign "{campaign.name}" started successfully!', 'success')
     return redirect(url_for('sending.index'))
@@ -94,9 +99,10 @@ def pause_campaign(campaign_id):
     campaign = Campaign.query.get_or_404(campaign_id)
     if campaign.status == 'running':
         campaign.status = 'paused'
-        sending_paused[campaign_id] = True
         db.session.commit()
-        log_event('INFO', f'Campaign "{campaign.name}" paused.', status='paused')
+        campaign_control.publish(campaign_id, 'paused')
+        status_buffer.flush() # Persist progress this process has buffered so far
+        log_event('INFO', f'Campaign "{campaign.name}" paused.', status='paused', campaign_id=campaign.id)
         telegram_settings = TelegramSettings.query.first()
         if telegram_settings and telegram_settings.alerts_enabled and telegram_settings.alert_sending_paused_resumed_stopped:
             send_telegram_message(telegram_settings.bot_token, telegram_settings.chat_id, f'Campaign <b>"{campaign.name}"</b> paused.')
@@ -109,9 +115,9 @@ def resume_campaign(campaign_id):
     campaign = Campaign.query.get_or_404(campaign_id)
     if campaign.status == 'paused':
         campaign.status = 'running'
-        sending_paused[campaign_id] = False
         db.session.commit()
-        log_event('INFO', f'Campaign "{campaign.name}" resumed.', status='resumed')
+        campaign_control.publish(campaign_id, 'running')
+        log_event('INFO', f'Campaign "{campaign.name}" resumed.', status='resumed', campaign_id=campaign.id)
         telegram_settings = TelegramSettings.query.first()
         if telegram_settings and telegram_settings.alerts_enabled and telegram_settings.alert_sending_paused_resumed_stopped:
             send_telegram_message(telegram_settings.bot_token, telegram_settings.chat_id, f'Campaign <b>"{campaign.name}"</b> resumed!')
@@ -125,11 +131,11 @@ def stop_campaign(campaign_id):
     campaign = Campaign.query.get_or_404(campaign_id)
     if campaign.status in ['running', 'paused']:
         campaign.status = 'stopped'
-        sending_stopped[campaign_id] = True
-        sending_paused[campaign_id] = False # Ensure it's not stuck in paused state
         campaign.completed_at = datetime.utcnow()
         db.session.commit()
-        log_event('INFO', f'Campaign "{campaign.name}" stopped.', status='stopped')
+        campaign_control.publish(campaign_id, 'stopped') # Also wakes a sender waiting out a pause
+        status_buffer.flush() # Persist progress this process has buffered so far
+        log_event('INFO', f'Campaign "{campaign.name}" stopped.', status='stopped', campaign_id=campaign.id)
         telegram_settings = TelegramSettings.query.first()
         if telegram_settings and telegram_settings.alerts_enabled and telegram_settings.alert_sending_paused_resumed_stopped:
             send_telegram_message(telegram_settings.bot_token, telegram_settings.chat_id, f'Campaign <b>"{campaign.name}"</b> stopped.')
@@ -144,7 +150,7 @@ def get_campaign_status(campaign_id):
     total_emails = campaign.total_emails
     emails_sent = campaign.emails_sent
     emails_failed = campaign.emails_failed
-    emails_pending = total_emails - emails_sent - emails_failed
+    emails_pending = campaign.emails_pending
 
     return jsonify({
         'status': campaign.status,
@@ -154,3 +160,49 @@ def get_campaign_status(campaign_id):
         'emails_pending': emails_pending,
         'progress': (emails_sent / total_emails * 100) if total_emails > 0 else 0
     })
+
+@bp.route('/campaign_statuses')
+@login_required
+def campaign_statuses():
+    # Status of many campaigns in one query: ?ids=1,2,3, or every campaign
+    # without ids. Served from a short-TTL cache with an ETag, so an unchanged
+    # poll gets a 304.
+    ids = request.args.get('ids')
+    campaign_ids = None
+    if ids is not None:
+        campaign_ids = [int(campaign_id) for campaign_id in ids.split(',') if campaign_id.strip().isdigit()]
+    body, etag = status_cache.get(campaign_ids)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache' # Always revalidate; the ETag makes that cheap
+    return response.make_conditional(request)
+
+@bp.route('/progress_stream')
+@login_required
+def progress_stream():
+    # Server-Sent Events: one 'progress' event per change, carrying
+    # {campaign_id: {status, counters, progress, rate_per_minute, eta_seconds}}
+    # for the campaigns that changed (every campaign in the first one).
+    # The stream needs nothing from the request or the DB session, so the
+    # session's pooled connection (used by login_required) is given back now
+    # rather than held for as long as the page stays open.
+    subscriber = progress_hub.subscribe()
+    db.session.remove()
+
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    payload = subscriber.get(timeout=PROGRESS_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                if payload is None:
+                    return # Fell behind; the browser reconnects and gets a fresh snapshot
+                yield f'event: progress\ndata: {payload}\n\n'
+        finally:
+            progress_hub.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -0,0 +1,56 @@
+import hashlib
+import json
+import threading
+import time
+from sqlalchemy import select
+from app import db
+from app.models import Campaign
+from app.progress import campaign_progress
+
+class CampaignStatusCache:
+    # Serialized campaign status responses, kept for `ttl` seconds (0 disables
+    # the cache) per requested id set, so any number of clients polling the
+    # batch status endpoint cost one query per TTL. Each body carries an ETag
+    # derived from its content.
+
+    def __init__(self, app=None):
+        self.ttl = 0.5
+        self.max_entries = 256
+        self._entries = {} # ids key -> (expires_at, body, etag)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('STATUS_CACHE_TTL', self.ttl)
+        app.extensions['status_cache'] = self
+
+    def get(self, campaign_ids=None):
+        # Returns (json body, etag) for the given campaign ids, or every campaign
+        key = tuple(sorted(set(campaign_ids))) if campaign_ids is not None else None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1], entry[2]
+
+        table = Campaign.__table__
+        query = select(table.c.id, table.c.status, table.c.total_emails, table.c.emails_sent,
+                       table.c.emails_failed, table.c.emails_pending).order_by(table.c.id)
+        if key is not None:
+            query = query.where(table.c.id.in_(key))
+        with db.engine.connect() as conn:
+            rows = conn.execute(query).all()
+        body = json.dumps({'campaigns': {str(row.id): campaign_progress(row) for row in rows}})
+        etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+        if self.ttl:
+            with self._lock:
+                if len(self._entries) >= self.max_entries:
+                    self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+                    if len(self._entries) >= self.max_entries:
+                        self._entries.clear()
+                self._entries[key] = (time.monotonic() + self.ttl, body, etag)
+        return body, etag
+
+status_cache = CampaignStatusCache()
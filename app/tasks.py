@@ -0,0 +1,61 @@
+from datetime import datetime
+from celery import chord
+from flask import current_app
+from app import celery, db
+from app.models import Campaign, TelegramSettings
+from app.email_utils import log_event, smtp_pool
+from app.send_engine import send_campaign
+from app.telegram.routes import send_telegram_message
+
+def complete_campaign(campaign_id, started_at=None):
+    # Marks a campaign completed unless it was paused or stopped while sending.
+    # With `started_at` (the run's Campaign.started_at) only that run completes
+    # it: a run that was stopped and then restarted belongs to the new run.
+    campaign = db.session.get(Campaign, campaign_id)
+    if not campaign or campaign.status != 'running':
+        return
+    if started_at is not None and campaign.started_at != started_at:
+        return
+    campaign.status = 'completed'
+    campaign.completed_at = datetime.utcnow()
+    db.session.commit()
+    log_event('INFO', f'Campaign "{campaign.name}" completed.', status='completed', campaign_id=campaign.id)
+    telegram_settings = TelegramSettings.query.first()
+    if telegram_settings and telegram_settings.alerts_enabled and telegram_settings.alert_sending_paused_resumed_stopped:
+        send_telegram_message(telegram_settings.bot_token, telegram_settings.chat_id, f'Campaign <b>"{campaign.name}"</b> completed!')
+
+@celery.task(name='app.tasks.run_campaign')
+def run_campaign(campaign_id, started_at=None):
+    # Starts CAMPAIGN_WORKERS claim workers on the campaign; they share its
+    # pending receivers through leases, and finish_campaign runs once all of
+    # them have run out of work. started_at (ISO format) identifies the run.
+    workers = max(1, current_app.config.get('CAMPAIGN_WORKERS', 4))
+    chord(send_claimed.s(campaign_id) for _ in range(workers))(finish_campaign.s(campaign_id, started_at))
+    return workers
+
+# acks_late means a worker task is only acknowledged once it has run out of
+# receivers; if the worker dies the broker redelivers it, and the receivers it
+# held come back to pending when their lease expires.
+@celery.task(name='app.tasks.send_claimed', acks_late=True, reject_on_worker_lost=True)
+def send_claimed(campaign_id):
+    campaign = db.session.get(Campaign, campaign_id)
+    if not campaign or campaign.status not in ('running', 'paused'):
+        return
+    concurrency = campaign.send_concurrency
+    db.session.commit()
+
+    # Pause/stop reach the worker through app.control, which watches Campaign.status
+    send_campaign(campaign_id, current_app._get_current_object(), concurrency=concurrency)
+
+@celery.task(name='app.tasks.finish_campaign')
+def finish_campaign(batch_results, campaign_id, started_at=None):
+    # batch_results is the chord's list of send_claimed results (all None)
+    smtp_pool.close_idle()
+    complete_campaign(campaign_id, datetime.fromisoformat(started_at) if started_at else None)
+
+@celery.task(name='app.tasks.import_receivers')
+def import_receivers(import_id):
+    # Imported here: app.receivers.routes imports this module, so a top-level
+    # import would be circular for anything importing app.tasks first
+    from app.receivers.importer import run_import
+    run_import(import_id)
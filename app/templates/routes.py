@@ -3,6 +3,7 @@ from flask_login import login_required
 from app import db
 from app.templates import bp
 from app.models import MessageTemplate
+from app.render import render_plans
 
 @bp.route('/')
 @login_required
@@ -39,7 +40,9 @@ def edit(template_id):
         template.subject = request.form.get('subject')
         template.body_html = request.form.get('body_html')
         template.body_plain = request.form.get('body_plain')
+        template.version = (template.version or 0) + 1 # Used from each campaign's next run; running campaigns keep the plan they started with
         db.session.commit()
+        render_plans.invalidate(template_id)
         flash('Message template updated successfully!', 'success')
         return redirect(url_for('templates.index'))
     return render_template('templates/add_edit.html', title='Edit Message Template', template=template)
@@ -50,6 +53,7 @@ def delete(template_id):
     template = MessageTemplate.query.get_or_404(template_id)
     db.session.delete(template)
     db.session.commit()
+    render_plans.invalidate(template_id)
     flash('Message template deleted successfully!', 'success')
     return redirect(url_for('templates.index'))
 
@@ -0,0 +1,130 @@
+import atexit
+import threading
+import time
+from collections import Counter
+from sqlalchemy import bindparam, update
+from app import db
+from app.models import ReceiverEmail, SenderEmail
+from app.counters import campaign_counter_update
+
+class StatusWriteBuffer:
+    # Write-behind buffer for the sending hot path. Receiver status transitions
+    # and sent/failed counters are collected in memory and flushed as a few
+    # set-based UPDATEs every `max_rows` transitions or `interval` seconds,
+    # instead of one commit per email. Counters are applied as `col = col + n`
+    # in SQL so concurrent workers never lose increments.
+
+    def __init__(self, app=None):
+        self.app = None
+        self.max_rows = 500
+        self.interval = 0.25
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock() # Keeps flushes in order
+        self._flusher = None
+        self._reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_rows = app.config.get('WRITE_BEHIND_MAX_ROWS', self.max_rows)
+        self.interval = app.config.get('WRITE_BEHIND_INTERVAL_MS', self.interval * 1000) / 1000.0
+        app.extensions['status_buffer'] = self
+        atexit.register(self.flush) # Don't lose buffered transitions on shutdown
+
+    def _reset(self):
+        self._receivers = {} # receiver_id -> (status, sent_at)
+        self._sender_sent = Counter()
+        self._campaign_sent = Counter()
+        self._campaign_failed = Counter()
+
+    def _start_flusher(self):
+        # Must be called with self._lock held
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._flush_periodically, name='status-write-buffer', daemon=True)
+            self._flusher.start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception("Failed to flush buffered receiver status updates")
+
+    def record_sent(self, receiver_id, sender_id, campaign_id, sent_at):
+        with self._lock:
+            self._receivers[receiver_id] = ('sent', sent_at)
+            self._sender_sent[sender_id] += 1
+            self._campaign_sent[campaign_id] += 1
+            full = len(self._receivers) >= self.max_rows
+            self._start_flusher()
+        if full:
+            self.flush()
+
+    def record_failed(self, receiver_id, campaign_id):
+        with self._lock:
+            self._receivers[receiver_id] = ('failed', None)
+            self._campaign_failed[campaign_id] += 1
+            full = len(self._receivers) >= self.max_rows
+            self._start_flusher()
+        if full:
+            self.flush()
+
+    def read_counters(self, read):
+        # Runs read() (a read of the campaign counters) while no flush is in
+        # progress and returns its result with the per-campaign sent/failed
+        # counts still buffered, so adding the two never counts a send twice
+        with self._flush_lock:
+            with self._lock:
+                campaign_sent, campaign_failed = Counter(self._campaign_sent), Counter(self._campaign_failed)
+            return read(), campaign_sent, campaign_failed
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                receivers, sender_sent = self._receivers, self._sender_sent
+                campaign_sent, campaign_failed = self._campaign_sent, self._campaign_failed
+                self._reset()
+            if not receivers and not sender_sent and not campaign_sent and not campaign_failed:
+                return
+            try:
+                with self.app.app_context():
+                    self._write(receivers, sender_sent, campaign_sent, campaign_failed)
+            except Exception:
+                self._restore(receivers, sender_sent, campaign_sent, campaign_failed) # Try again on the next flush
+                raise
+
+    def _restore(self, receivers, sender_sent, campaign_sent, campaign_failed):
+        with self._lock:
+            for receiver_id, change in receivers.items():
+                self._receivers.setdefault(receiver_id, change)
+            self._sender_sent.update(sender_sent)
+            self._campaign_sent.update(campaign_sent)
+            self._campaign_failed.update(campaign_failed)
+
+    def _write(self, receivers, sender_sent, campaign_sent, campaign_failed):
+        receiver_table = ReceiverEmail.__table__
+        sender_table = SenderEmail.__table__
+        sent = [{'receiver_id': receiver_id, 'receiver_sent_at': sent_at}
+                for receiver_id, (status, sent_at) in receivers.items() if status == 'sent']
+        failed = [receiver_id for receiver_id, (status, _) in receivers.items() if status == 'failed']
+
+        with db.engine.begin() as conn:
+            if sent:
+                conn.execute(update(receiver_table)
+                             .where(receiver_table.c.id == bindparam('receiver_id'))
+                             .values(status='sent', sent_at=bindparam('receiver_sent_at'), claimed_by=None, lease_expires_at=None), sent)
+            for i in range(0, len(failed), 500):
+                conn.execute(update(receiver_table)
+                             .where(receiver_table.c.id.in_(failed[i:i + 500]))
+                             .values(status='failed', claimed_by=None, lease_expires_at=None))
+            for sender_id, count in sender_sent.items():
+                conn.execute(update(sender_table)
+                             .where(sender_table.c.id == sender_id)
+                             .values(sent_count=sender_table.c.sent_count + count))
+            for campaign_id in set(campaign_sent) | set(campaign_failed):
+                sent, failed = campaign_sent[campaign_id], campaign_failed[campaign_id]
+                conn.execute(campaign_counter_update(campaign_id, pending=-(sent + failed), sent=sent, failed=failed))
+
+status_buffer = StatusWriteBuffer()
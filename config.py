@@ -5,9 +5,50 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///app.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL') or 'redis://localhost:6379/0'
-    CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND') or 'redis://localhost:6379/0'
-    CELERY_IMPORTS = ('app.email_utils',) # Specify modules containing Celery tasks
+    CELERY_ALWAYS_EAGER = os.environ.get('CELERY_ALWAYS_EAGER', 'false').lower() == 'true' # Run tasks in-process (tests, no broker)
+    # run_campaign's chord needs a result backend, eager mode included
+    CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND') or ('cache+memory://' if CELERY_ALWAYS_EAGER else 'redis://localhost:6379/0')
+    CELERY_IMPORTS = ('app.email_utils', 'app.tasks', 'app.counters', 'app.retention') # Specify modules containing Celery tasks
+    CAMPAIGN_RUNNER = os.environ.get('CAMPAIGN_RUNNER') or 'thread' # 'thread' (in-process) or 'celery' (worker pipeline)
+    CAMPAIGN_BATCH_SIZE = int(os.environ.get('CAMPAIGN_BATCH_SIZE', 500)) # Receivers a worker claims at a time
+    CAMPAIGN_WORKERS = int(os.environ.get('CAMPAIGN_WORKERS', 4)) # Celery tasks sharing one campaign
+    RECEIVER_LEASE_SECONDS = int(os.environ.get('RECEIVER_LEASE_SECONDS', 300)) # Claimed receivers return to pending if not renewed within this
+    CAMPAIGN_CONTROL_INTERVAL = float(os.environ.get('CAMPAIGN_CONTROL_INTERVAL', 0.25)) # Seconds between pause/stop checks of other processes' clicks
+    PROGRESS_INTERVAL = float(os.environ.get('PROGRESS_INTERVAL', 1.0)) # Seconds between live progress pushes to the sending page
+    PROGRESS_RATE_WINDOW = float(os.environ.get('PROGRESS_RATE_WINDOW', 30)) # Seconds of history behind the rate and ETA shown
+    STATUS_CACHE_TTL = float(os.environ.get('STATUS_CACHE_TTL', 0.5)) # Seconds a batch campaign status response is reused
+    CELERYBEAT_SCHEDULE = {'purge-expired-logs': {'task': 'app.retention.purge_expired_logs', 'schedule': 3600.0}}
     TELEGRAM_BOT_TOKEN = os.environ.get('8309194161:AAHwrChFv2aACvdRIvTfgVyp6Bl00_ewlO4')
     TELEGRAM_CHAT_ID = os.environ.get('1248118664')
     PORT = os.environ.get('PORT', 5000)
+    SMTP_HOST = os.environ.get('SMTP_HOST') or 'smtp.gmail.com'
+    SMTP_PORT = int(os.environ.get('SMTP_PORT', 465))
+    SMTP_USE_SSL = os.environ.get('SMTP_USE_SSL', 'true').lower() == 'true'
+    SMTP_TIMEOUT = int(os.environ.get('SMTP_TIMEOUT', 30))
+    SMTP_POOL_MAX_PER_SENDER = int(os.environ.get('SMTP_POOL_MAX_PER_SENDER', 2)) # Open sessions kept per sender
+    SMTP_POOL_IDLE_TIMEOUT = int(os.environ.get('SMTP_POOL_IDLE_TIMEOUT', 60)) # Seconds before an idle session is closed
+    SMTP_POOL_NOOP_INTERVAL = int(os.environ.get('SMTP_POOL_NOOP_INTERVAL', 10)) # Health-check sessions idle longer than this
+    CREDENTIAL_CACHE_TTL = int(os.environ.get('CREDENTIAL_CACHE_TTL', 300)) # Seconds a decrypted sender password stays in memory, 0 disables caching
+    SEND_CONCURRENCY = int(os.environ.get('SEND_CONCURRENCY', 4)) # Default in-flight sends per campaign
+    SEND_CHUNK_SIZE = int(os.environ.get('SEND_CHUNK_SIZE', 10)) # Receivers a send slot takes per executor hop
+    GLOBAL_RATE_PER_MINUTE = int(os.environ.get('GLOBAL_RATE_PER_MINUTE', 0)) # Cap across all senders and workers, 0 disables it
+    GLOBAL_RATE_BURST = int(os.environ.get('GLOBAL_RATE_BURST', 1))
+    RETRY_MAX_ATTEMPTS = int(os.environ.get('RETRY_MAX_ATTEMPTS', 3)) # Retries for transient (non-5xx) failures
+    RETRY_BASE_DELAY = float(os.environ.get('RETRY_BASE_DELAY', 5)) # Seconds before the first retry, doubled each attempt
+    RETRY_MAX_DELAY = float(os.environ.get('RETRY_MAX_DELAY', 300))
+    SENDER_COOLDOWN_SECONDS = float(os.environ.get('SENDER_COOLDOWN_SECONDS', 60)) # Rest for a sender whose server refused or dropped it
+    WRITE_BEHIND_MAX_ROWS = int(os.environ.get('WRITE_BEHIND_MAX_ROWS', 500)) # Flush buffered status updates after this many...
+    WRITE_BEHIND_INTERVAL_MS = int(os.environ.get('WRITE_BEHIND_INTERVAL_MS', 250)) # ...or after this long
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000)) # Log records buffered before backpressure kicks in
+    LOG_BATCH_SIZE = int(os.environ.get('LOG_BATCH_SIZE', 500))
+    LOG_FLUSH_INTERVAL_MS = int(os.environ.get('LOG_FLUSH_INTERVAL_MS', 500))
+    LOG_BACKPRESSURE = os.environ.get('LOG_BACKPRESSURE') or 'block' # 'block', 'drop_info' or 'spill'
+    LOG_SPILL_PATH = os.environ.get('LOG_SPILL_PATH') # Defaults to instance/log_spill.jsonl
+    LOG_RETENTION_DAYS = int(os.environ.get('LOG_RETENTION_DAYS', 90)) # Purged hourly by Celery beat or `flask logs purge`, 0 keeps logs forever
+    LOG_PURGE_CHUNK_SIZE = int(os.environ.get('LOG_PURGE_CHUNK_SIZE', 1000)) # Log rows deleted per transaction
+    LOG_ARCHIVE = os.environ.get('LOG_ARCHIVE', 'true').lower() == 'true' # Archive purged logs to gzipped files before deleting them
+    LOG_ARCHIVE_PATH = os.environ.get('LOG_ARCHIVE_PATH') # Defaults to instance/log_archive
+    IMPORT_UPLOAD_FOLDER = os.environ.get('IMPORT_UPLOAD_FOLDER') # Defaults to instance/imports; must be shared with Celery workers
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 2000)) # Receivers per bulk INSERT
+    TEMPLATE_CACHE_SIZE = int(os.environ.get('TEMPLATE_CACHE_SIZE', 64)) # Compiled template versions kept per process
 
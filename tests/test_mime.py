@@ -0,0 +1,61 @@
+import email
+from email.header import decode_header, make_header
+from types import SimpleNamespace
+import pytest
+from app.mime import build_message, flatten
+from app.render import MessagePlan, personalization_fields
+
+# MessageSkeleton.render splices headers and values into pre-encoded bytes, so
+# every message it does produce must be byte for byte what the generator makes
+# of the MIMEMultipart build, and read back the same.
+
+SENDER = 'sender@example.com'
+
+def make_plan(subject, body_html, body_plain=None):
+    return MessagePlan(SimpleNamespace(id=1, version=1, subject=subject, body_html=body_html, body_plain=body_plain))
+
+def expected_bytes(plan, fields, receiver_email):
+    return flatten(build_message(plan, fields, SENDER, receiver_email, boundary=plan.skeleton.boundary))
+
+def assert_round_trip(plan, fields, receiver_email):
+    raw = plan.skeleton.render(fields, SENDER, receiver_email)
+    assert raw is not None
+    assert raw == expected_bytes(plan, fields, receiver_email)
+
+    parsed = email.message_from_bytes(raw)
+    assert parsed['From'] == SENDER
+    assert parsed['To'] == receiver_email
+    subject = parsed['Subject'].replace('\r\n', '').replace('\n', '') # Unfold
+    assert str(make_header(decode_header(subject))) == plan.subject.render(fields)
+    parts = [part for part in parsed.walk() if not part.is_multipart()]
+    expected_parts = ([('text/plain', plan.plain.render(fields))] if plan.plain else []) + [('text/html', plan.html.render(fields))]
+    assert [(part.get_content_type(), part.get_payload(decode=True).decode(part.get_content_charset()))
+            for part in parts] == expected_parts
+
+@pytest.mark.parametrize('subject, body_html, body_plain, receiver_email, campaign', [
+    ('Hi {name}', '<p>Hello {name} from {campaign}</p>', 'Hello {name} at {domain}', 'bob@example.com', 'Spring'),
+    ('Hi {name}', '<p>Grüße {name}</p>', 'Grüße {name} – {domain}', 'bob@example.com', 'Spring'),
+    ('Hi {name}', '<p>Hello {name}</p>', 'Grüße {name}', 'bob@example.com', 'Spring'),
+    ('Hi {name}', '<p>Hello {name}</p>', None, 'bob@example.com', 'Spring'),
+    ('Hi {name}', '<p>Grüße {name}</p>', None, 'bob@example.com', 'Spring'),
+    ('A very long subject line that keeps going well past the seventy-eight column limit for {name} at {domain}',
+     '<p>Hello</p>', 'Hello', 'bob@example.com', 'Spring'),
+    ('Grüße {name}', '<p>Hello</p>', None, 'bob@example.com', 'Spring'),
+    ('Hi from {campaign}', '<p>Hello</p>', None, 'bob@example.com', 'Frühling'),
+], ids=['ascii', 'utf8', 'mixed', 'no-plain-ascii', 'no-plain-utf8', 'long-subject', 'non-ascii-subject', 'non-ascii-subject-value'])
+def test_render_matches_generator(subject, body_html, body_plain, receiver_email, campaign):
+    plan = make_plan(subject, body_html, body_plain)
+    assert plan.skeleton.enabled
+    assert_round_trip(plan, personalization_fields(receiver_email, campaign), receiver_email)
+
+@pytest.mark.parametrize('body_plain, receiver_email, campaign', [
+    ('Hello {campaign}', 'bob@example.com', 'Line one\nLine two'),
+    ('Hello\n{campaign}', 'bob@example.com', 'From the team'),
+    ('Hello {name}', 'björn@example.com', 'Spring'),
+], ids=['newline-in-value', 'from-line', 'non-ascii-recipient'])
+def test_render_falls_back(body_plain, receiver_email, campaign):
+    # Messages the skeleton can't reproduce exactly are left to build_message
+    plan = make_plan('Hi {name}', '<p>Hello</p>', body_plain)
+    fields = personalization_fields(receiver_email, campaign)
+    assert plan.skeleton.render(fields, SENDER, receiver_email) is None
+    expected_bytes(plan, fields, receiver_email) # The fallback itself still builds